@@ -1,41 +1,183 @@
 import os
-import glob
-import datetime
 import shutil
+import argparse
+import datetime
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, NamedTuple, Optional, Tuple
 
 create_directory_folder = r"C:\Users\MM14475.CO\Desktop\A\LoggingLog"
 copy_directory_folder = r"\\m5fsv01\KMM共有領域\KA5300\J_環境管理\80_施設MDASプロジェクト\KA1018_nomi\A\LoggingLog"
 
-# nodeで始まるフォルダ名を取得
-create_list = [d for d in os.listdir(copy_directory_folder) if d.startswith("node") and os.path.isdir(os.path.join(copy_directory_folder, d))]
-
-# create_directory_folderにnodeフォルダを作成
-for node in create_list:
-    create_path = os.path.join(create_directory_folder, node)
-    if not os.path.exists(create_path):
-        os.makedirs(create_path)
-        print(f"Created directory: {create_path}")
-    else:
-        print(f"Directory already exists: {create_path}")
-
 # 日付範囲
 threshold = 20250420
-today = int(datetime.datetime.now().strftime("%Y%m%d"))
-
-# 各nodeフォルダ内のCSVファイルをコピー
-for node in create_list:
-    src_node_path = os.path.join(copy_directory_folder, node)
-    dst_node_path = os.path.join(create_directory_folder, node)
-    csv_files = glob.glob(os.path.join(src_node_path, "*.CSV"))
-    for file in csv_files:
-        filename = os.path.basename(file)
-        # ファイル名から日付部分を抽出（例: node1-17_20250421.CSV → 20250421）
-        try:
-            date_part = filename.split("_")[-1].replace(".CSV", "")
-            file_date = int(date_part)
-            if threshold <= file_date <= today:
-                dst_file = os.path.join(dst_node_path, filename)
-                shutil.copy2(file, dst_file)
-                print(f"Copied: {file} -> {dst_file}")
-        except Exception as e:
-            print(f"Skipped {filename}: {e}")
\ No newline at end of file
+# 同時に転送するファイル数
+COPY_THREADS = 8
+# 転送の読み書き単位
+COPY_BLOCK_SIZE = 1024 * 1024
+# 途中まで転送したファイルを再開する前に、末尾のこのバイト数をコピー元と照合する
+RESUME_CHECK_SIZE = 64 * 1024
+# 更新日時の比較の許容差[s](共有フォルダの更新日時は2秒単位のことがある)
+MTIME_TOLERANCE = 2.0
+# 転送中のファイルの拡張子。転送が終わってから元の名前に置き換える
+PARTIAL_SUFFIX = '.part'
+
+
+class CopyResult(NamedTuple):
+    """
+    1ファイルの転送結果。statusはcopied, resumed, skipped, failedのいずれか。
+    """
+    src_path: str
+    dst_path: str
+    status: str
+    bytes_copied: int = 0
+    error: Optional[str] = None
+
+
+def file_date(filename: str) -> Optional[int]:
+    """
+    ファイル名から日付部分を抽出する（例: node1-17_20250421.CSV → 20250421）。
+    """
+    try:
+        return int(filename.split("_")[-1].replace(".CSV", ""))
+    except ValueError:
+        return None
+
+
+def is_up_to_date(src_stat: os.stat_result, dst_path: str) -> bool:
+    """
+    コピー先がコピー元とサイズ・更新日時が一致していればTrueを返す。
+    """
+    try:
+        dst_stat = os.stat(dst_path)
+    except FileNotFoundError:
+        return False
+    return (dst_stat.st_size == src_stat.st_size
+            and abs(dst_stat.st_mtime - src_stat.st_mtime) <= MTIME_TOLERANCE)
+
+
+def can_resume(src_path: str, part_path: str, src_size: int) -> int:
+    """
+    途中まで転送したファイルから再開できる場合は再開位置を返す。できない場合は0を返す。
+    ロガーCSVは追記のみのため、転送済みの末尾がコピー元と一致すれば続きから転送する。
+    """
+    try:
+        part_size = os.path.getsize(part_path)
+    except FileNotFoundError:
+        return 0
+    if part_size == 0 or part_size > src_size:
+        return 0
+    check_size = min(RESUME_CHECK_SIZE, part_size)
+    with open(src_path, 'rb') as src, open(part_path, 'rb') as part:
+        src.seek(part_size - check_size)
+        part.seek(part_size - check_size)
+        if src.read(check_size) != part.read(check_size):
+            return 0
+    return part_size
+
+
+def copy_file(src_path: str, dst_path: str) -> CopyResult:
+    """
+    1ファイルを転送する。サイズ・更新日時が一致するファイルは転送せず、
+    途中まで転送したファイル(.part)があれば続きから転送する。
+    """
+    try:
+        src_stat = os.stat(src_path)
+        if is_up_to_date(src_stat, dst_path):
+            return CopyResult(src_path, dst_path, "skipped")
+        part_path = dst_path + PARTIAL_SUFFIX
+        offset = can_resume(src_path, part_path, src_stat.st_size)
+        with open(src_path, 'rb') as src, open(part_path, 'ab' if offset else 'wb') as dst:
+            src.seek(offset)
+            shutil.copyfileobj(src, dst, COPY_BLOCK_SIZE)
+            bytes_copied = dst.tell() - offset
+        shutil.copystat(src_path, part_path)
+        os.replace(part_path, dst_path)
+        return CopyResult(src_path, dst_path, "resumed" if offset else "copied", bytes_copied)
+    except OSError as e:
+        return CopyResult(src_path, dst_path, "failed", error=str(e))
+
+
+def list_copy_jobs(src_root: str, dst_root: str, date_from: int, date_to: int) -> List[Tuple[str, str]]:
+    """
+    コピー元のnodeフォルダ内の*.CSVのうち、日付が範囲内のものを列挙する。
+    コピー先のnodeフォルダがなければ作成する。
+    """
+    jobs = []
+    with os.scandir(src_root) as node_entries:
+        node_folders = [entry for entry in node_entries if entry.name.startswith("node") and entry.is_dir()]
+    for node_entry in node_folders:
+        dst_node_path = os.path.join(dst_root, node_entry.name)
+        if not os.path.exists(dst_node_path):
+            os.makedirs(dst_node_path)
+            print(f"Created directory: {dst_node_path}")
+        with os.scandir(node_entry.path) as file_entries:
+            for entry in file_entries:
+                if not entry.name.endswith(".CSV") or not entry.is_file():
+                    continue
+                date = file_date(entry.name)
+                if date is None:
+                    print(f"Skipped {entry.name}: invalid date")
+                    continue
+                if date_from <= date <= date_to:
+                    jobs.append((entry.path, os.path.join(dst_node_path, entry.name)))
+    return jobs
+
+
+def copy_logger_files(src_root: str, dst_root: str, date_from: int, date_to: int,
+                      threads: int = COPY_THREADS) -> List[CopyResult]:
+    """
+    ロガーCSVをスレッドプールで並列に転送する。結果は列挙した順に返す。
+    """
+    jobs = list_copy_jobs(src_root, dst_root, date_from, date_to)
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        results = list(executor.map(lambda job: copy_file(*job), jobs))
+    for result in results:
+        if result.status in ("copied", "resumed"):
+            print(f"{result.status.capitalize()}: {result.src_path} -> {result.dst_path}")
+        elif result.status == "failed":
+            print(f"Failed {result.src_path}: {result.error}")
+    return results
+
+
+def write_manifest(results: List[CopyResult], manifest_path: str, today: int) -> List[str]:
+    """
+    前処理に渡すファイル一覧(絶対パス)を書き出す。転送したファイルに加え、当日分は最新値の出力に
+    毎回必要なため転送しなかった場合も含める。
+    """
+    paths = [
+        os.path.abspath(result.dst_path) for result in results
+        if result.status in ("copied", "resumed")
+        or (result.status == "skipped" and file_date(os.path.basename(result.dst_path)) == today)
+    ]
+    manifest_dir = os.path.dirname(manifest_path)
+    if manifest_dir:
+        os.makedirs(manifest_dir, exist_ok=True)
+    with open(manifest_path, 'w', encoding='utf-8') as f:
+        f.writelines(f"{path}\n" for path in paths)
+    return paths
+
+
+def main():
+    parser = argparse.ArgumentParser(description="共有フォルダのロガーCSVをローカルへ転送する")
+    parser.add_argument("--src", default=copy_directory_folder, help="コピー元のLoggingLogフォルダ")
+    parser.add_argument("--dst", default=create_directory_folder, help="コピー先のLoggingLogフォルダ")
+    parser.add_argument("--threads", type=int, default=COPY_THREADS, help="同時に転送するファイル数")
+    parser.add_argument("--threshold", type=int, default=threshold, help="転送するファイルの最初の日付(yyyymmdd)")
+    parser.add_argument("--manifest", help="転送したファイルの一覧の出力先(前処理の--file-listに渡す)")
+    args = parser.parse_args()
+
+    today = int(datetime.datetime.now().strftime("%Y%m%d"))
+    results = copy_logger_files(args.src, args.dst, args.threshold, today, args.threads)
+    counts = {status: 0 for status in ("copied", "resumed", "skipped", "failed")}
+    for result in results:
+        counts[result.status] += 1
+    total_bytes = sum(result.bytes_copied for result in results)
+    print(f"Copied {counts['copied']}, resumed {counts['resumed']}, skipped {counts['skipped']}, "
+          f"failed {counts['failed']} ({total_bytes / 1024 / 1024:.1f} MB)")
+    if args.manifest:
+        paths = write_manifest(results, args.manifest, today)
+        print(f"Manifest: {args.manifest} ({len(paths)} files)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,971 @@
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+from wsn_decoder import ScaleTable, SensTypeTable
+from wsn_engine import LONG_COLUMNS, VALUE_DTYPES, scale_wide_frame
+from wsn_layout import NODE_BLOCK_WIDTH, generate_node_list, get_node_layout, layout_from_header, VALUE_SLOTS
+from wsn_output import OUTPUT_CSV_ENCODING, OUTPUT_MODES, output_target, wide_output_target, write_long_frame
+from wsn_presence import DEFAULT_SAMPLE_ROWS, sample_populated_nodes
+from wsn_reader import (
+    INGEST_BACKENDS, LOGGER_ENCODING, LOGGER_TIME_FORMAT, header_layout, ingest_layout, iter_logger_csv,
+    parse_logger_bytes, read_complete_lines, read_header
+)
+from wsn_scanner import LogFolderScanner
+from wsn_snapshot import LatestValueStore
+
+SETTING_DIR_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'setting')
+SCALE_JSON_PATH = os.path.join(SETTING_DIR_PATH, 'wsn_scale.json')
+SENS_TYPE_JSON_PATH = os.path.join(SETTING_DIR_PATH, 'sens_type.json')
+# 合成するロガーCSVのカラム名行の前のメタデータ行
+LOGGER_PREAMBLE = ["ゲートウェイ名,WSN-BENCH", "ロギング開始,{start}"]
+# パイプラインのベンチマークで計測する段階
+PIPELINE_STAGES = ("read", "scale", "write")
+# カラム名行からのカラム配置の確認に使うロガーCSVの形(ノードの並びが逆で末尾に余分なカラムがある、
+# フォルダ名のノードID範囲より少ないノードだけがある、カラム名にノード番号がない、
+# カラム名の形式が異なり末尾に余分なカラムがある)
+HEADER_CASES = ("reordered", "subset", "bare", "unnamed")
+# 並べ替えの比較に使うTIMEの並び(昇順、同じ時刻の行を含む、一部の行が逆行)
+TIME_ORDER_CASES = ("ordered", "duplicated", "reversed")
+# 測定種別名が重複するセンサ種別コード(検出エッジ2[-]が2回ある)と、横持ちデータで重複した名前に付く値の番号
+DUPLICATE_NAME_SENS_CODE = 29
+DUPLICATE_NAME_PATTERN = r'\(値\d+\)$'
+
+
+def load_settings() -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """
+    スケールとセンサ種別の定義を読み込む。
+    """
+    with open(SCALE_JSON_PATH, 'r', encoding='utf-8') as file:
+        df_scale = pd.DataFrame(json.load(file))
+    df_sens_type = pd.read_json(SENS_TYPE_JSON_PATH, encoding="utf-8")
+    return df_scale, df_sens_type
+
+
+def parse_node_range(text: str) -> Tuple[int, int]:
+    start, end = text.split('-')
+    return int(start), int(end)
+
+
+def make_wide_frame(start_node: int, end_node: int, n_rows: int, df_scale: pd.DataFrame,
+                    df_sens_type: pd.DataFrame, empty_ratio: float = 0.3, seed: int = 0,
+                    start: str = '2025-04-21', sens_codes: Optional[Sequence[int]] = None) -> pd.DataFrame:
+    """
+    ロガーCSVを読み込んだ直後と同じ形の横持ちデータを合成する。
+    Args:
+        empty_ratio (float): データのないノードの割合
+        start (str): 最初の行の日時(30秒間隔で並べる)
+        sens_codes (Sequence[int]): 使うセンサ種別コード(Noneの場合はsens_type.jsonの全コード)
+    """
+    rng = np.random.default_rng(seed)
+    if sens_codes is None:
+        sens_codes = df_sens_type['sens_code_dec'].dropna().to_numpy()
+    scale_codes = df_scale['scale_code_dec'].to_numpy()
+    times = pd.date_range(start, periods=n_rows, freq='30s').strftime('%Y/%m/%d %H:%M:%S')
+    columns = generate_node_list(start_node, end_node)
+    data = {columns[0]: times}
+    position = 1
+    for node_id in range(start_node, end_node + 1):
+        node_columns = columns[position:position + 3 + VALUE_SLOTS * 3]
+        position += len(node_columns)
+        if rng.random() < empty_ratio:
+            for column in node_columns:
+                data[column] = np.full(n_rows, np.nan)
+            continue
+        # ノードが受信できなかった行は欠損にする
+        missing = rng.random(n_rows) < 0.2
+        data[node_columns[0]] = np.where(missing, np.nan, node_id)
+        data[node_columns[1]] = np.where(missing, np.nan, rng.integers(-90, -30, n_rows))
+        data[node_columns[2]] = np.where(missing, np.nan, rng.choice(sens_codes))
+        for i in range(VALUE_SLOTS):
+            data[node_columns[3 + i * 3]] = np.where(missing, np.nan, rng.integers(0, 5000, n_rows))
+            data[node_columns[4 + i * 3]] = np.where(missing, np.nan, rng.choice(scale_codes))
+            data[node_columns[5 + i * 3]] = np.where(missing, np.nan, 3)
+    return pd.DataFrame(data)
+
+
+def write_logger_csv(df: pd.DataFrame, file_path: str) -> None:
+    """
+    横持ちデータをロガーCSVと同じ形式(cp932、メタデータ行2行、CRLF)で書き出す。
+    """
+    os.makedirs(os.path.dirname(file_path), exist_ok=True)
+    with open(file_path, 'w', encoding=LOGGER_ENCODING, newline='') as f:
+        for line in LOGGER_PREAMBLE:
+            f.write(line.format(start=df.iloc[0, 0] if len(df) else '') + '\r\n')
+        df.to_csv(f, index=False, lineterminator='\r\n', float_format='%.10g')
+
+
+def generate_logger_files(output_dir: str, node_ranges: List[Tuple[int, int]], days: int, n_rows: int,
+                          empty_ratio: float = 0.3, seed: int = 0,
+                          sens_codes: Optional[Sequence[int]] = None,
+                          first_day: str = '20250421') -> List[Tuple[str, int, int]]:
+    """
+    LoggingLogと同じ構成(node{a}-{b}/node{a}-{b}_{yyyymmdd}.CSV)で合成データを書き出す。
+    Returns:
+        List[Tuple[str, int, int]]: ファイルパスとノードID範囲
+    """
+    df_scale, df_sens_type = load_settings()
+    files = []
+    for day in range(days):
+        yyyymmdd = (datetime.strptime(first_day, '%Y%m%d') + timedelta(days=day)).strftime('%Y%m%d')
+        for range_index, (start_node, end_node) in enumerate(node_ranges):
+            df = make_wide_frame(start_node, end_node, n_rows, df_scale, df_sens_type, empty_ratio,
+                                 seed + day * len(node_ranges) + range_index, yyyymmdd, sens_codes)
+            node_range = f'node{start_node}-{end_node}'
+            file_path = os.path.join(output_dir, node_range, f'{node_range}_{yyyymmdd}.CSV')
+            write_logger_csv(df, file_path)
+            files.append((file_path, start_node, end_node))
+    return files
+
+
+def find_logger_files(logging_dir: str) -> List[Tuple[str, int, int]]:
+    """
+    LoggingLogと同じ構成のフォルダからロガーCSVとノードID範囲を列挙する。
+    """
+    files = []
+    for node_range in sorted(os.listdir(logging_dir)):
+        node_dir = os.path.join(logging_dir, node_range)
+        if not node_range.startswith('node') or not os.path.isdir(node_dir):
+            continue
+        start_node, end_node = parse_node_range(node_range[len('node'):])
+        files.extend((os.path.join(node_dir, name), start_node, end_node) for name in sorted(os.listdir(node_dir)))
+    return files
+
+
+def reset_peak_rss() -> bool:
+    """
+    プロセスの最大RSSをリセットする(Linuxのみ)。リセットできない場合はFalseを返す。
+    """
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+        return True
+    except OSError:
+        return False
+
+
+def peak_rss() -> int:
+    """
+    プロセスの最大RSS[byte]を返す。
+    """
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    try:
+        import resource
+    except ImportError:
+        return 0
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return max_rss if sys.platform == 'darwin' else max_rss * 1024
+
+
+def legacy_scale_file(df: pd.DataFrame, start_node: int, end_node: int,
+                      df_scale: pd.DataFrame, df_sens_type: pd.DataFrame) -> pd.DataFrame:
+    """
+    ver2.2のノード単位ループによる変換(比較用)。
+    スケールはscale_code_decをキーとして引く。
+    """
+    scale_by_code = df_scale.set_index('scale_code_dec')['scale']
+    df = df.copy()
+    df.columns = generate_node_list(start_node, end_node)
+    df_tmp_time = df.TIME.copy()
+    df_scaled = pd.DataFrame()
+    for node_id in range(start_node, end_node + 1):
+        df_tmp = df.loc[:, df.columns.str.contains(f'{node_id:04d}')].copy()
+        if df_tmp.iloc[:, 0].isnull().all():
+            continue
+        df_filtered_sens_type = df_sens_type[df_sens_type['sens_code_dec'] == df_tmp.iloc[-1, 2]]
+        df_filtered_sens_columns = list(filter(lambda x: not pd.isna(x), df_filtered_sens_type.values.flatten().tolist()))[3:]
+        value_columns = [col for col in df_tmp.columns if "値" in col][:len(df_filtered_sens_columns)]
+        scale_columns = [col for col in df_tmp.columns if "スケール" in col][:len(df_filtered_sens_columns)]
+        for v_col, s_col in zip(value_columns, scale_columns):
+            df_tmp[s_col] = df_tmp[s_col].astype(float)
+            df_tmp.loc[:, s_col] = df_tmp.loc[:, s_col].map(scale_by_code)
+        result = df_tmp.loc[:, scale_columns].values * df_tmp.loc[:, value_columns].values
+        df_tmp_scaled = pd.DataFrame(result, columns=df_tmp.loc[:, value_columns].columns, index=df_tmp.index)
+        df_tmp_scaled.columns = df_filtered_sens_columns
+        df_result = pd.concat([df_tmp_time, df_tmp.iloc[:, 0:2], df_tmp_scaled], axis=1)
+        df_result.rename(columns={f"ノード{node_id:04d}:ノードID": "ノードID"}, inplace=True)
+        df_result.rename(columns={f"ノード{node_id:04d}:電波強度": "電波強度[dB]"}, inplace=True)
+        df_result_melt = df_result.melt(id_vars=["TIME", "ノードID"], var_name="測定種別", value_name="測定値")
+        df_scaled = pd.concat([df_scaled, df_result_melt], axis=0)
+    if df_scaled.shape == (0, 0):
+        return df_scaled
+    df_scaled = df_scaled.dropna()
+    df_scaled["ノードID"] = df_scaled["ノードID"].astype(int)
+    return df_scaled
+
+
+def legacy_scale_by_sens_type(df: pd.DataFrame, start_node: int, end_node: int,
+                              df_scale: pd.DataFrame, df_sens_type: pd.DataFrame) -> pd.DataFrame:
+    """
+    legacy_scale_fileをノードごと・センサ種別ごとの行に分けて適用し、各行をその行のセンサ種別の
+    測定種別名で変換した縦持ちデータを作成する(比較用)。行はTIMEで安定ソートした順とする。
+    """
+    df = df.copy()
+    df.columns = generate_node_list(start_node, end_node)
+    frames = []
+    for node_id in range(start_node, end_node + 1):
+        df_node = df[[df.columns[0]] + [col for col in df.columns if col.startswith(f"ノード{node_id:04d}:")]]
+        present = df_node.iloc[:, 1].notna()
+        sens_codes = df_node.iloc[:, 3].fillna(-1)
+        for sens_code in sens_codes[present].unique():
+            frames.append(legacy_scale_file(df_node[present & (sens_codes == sens_code)], node_id, node_id,
+                                            df_scale, df_sens_type))
+    frames = [frame for frame in frames if len(frame)]
+    if not frames:
+        return pd.DataFrame(columns=LONG_COLUMNS)
+    return pd.concat(frames, ignore_index=True).sort_values(by="TIME", kind='stable')
+
+
+def swap_sensors(df: pd.DataFrame, start_node: int, end_node: int, df_sens_type: pd.DataFrame,
+                 seed: int = 0) -> pd.DataFrame:
+    """
+    データのある各ノードについて、ランダムな行以降のセンサ種別を別のコードに置き換える(途中でのセンサ交換)。
+    """
+    rng = np.random.default_rng(seed)
+    sens_codes = df_sens_type['sens_code_dec'].dropna().to_numpy()
+    df = df.copy()
+    for i in range(end_node - start_node + 1):
+        column = 1 + i * (3 + VALUE_SLOTS * 3) + 2
+        present = df.iloc[:, column].notna().to_numpy()
+        if not present.any():
+            continue
+        swap_row = rng.integers(1, len(df))
+        new_code = rng.choice(sens_codes[sens_codes != df.iloc[:, column][present].iloc[0]])
+        df.iloc[swap_row:, column] = np.where(present[swap_row:], new_code, np.nan)
+    return df
+
+
+def to_reference_schema(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    縦持ちデータをver2.2と同じ型(TIMEは文字列、ノードIDはint64、測定種別は文字列、測定値はfloat64)に戻す。
+    """
+    time_column = df["TIME"]
+    if pd.api.types.is_datetime64_any_dtype(time_column):
+        time_column = time_column.dt.strftime(LOGGER_TIME_FORMAT)
+    return pd.DataFrame({
+        "TIME": time_column.astype(object),
+        "ノードID": df["ノードID"].astype(np.int64),
+        "測定種別": df["測定種別"].astype(object),
+        "測定値": df["測定値"].astype(np.float64),
+    }, index=df.index)
+
+
+def assert_same_long_frame(expected: pd.DataFrame, actual: pd.DataFrame) -> None:
+    """
+    縦持ちデータが行順と型を除いて一致することを確認する。
+    測定値はfloat32の精度(相対誤差1e-6)で比較する。
+    """
+    keys = ["TIME", "ノードID", "測定種別", "測定値"]
+    expected = to_reference_schema(expected).sort_values(keys, kind='stable').reset_index(drop=True)
+    actual = to_reference_schema(actual).sort_values(keys, kind='stable').reset_index(drop=True)
+    pd.testing.assert_frame_equal(expected, actual, check_exact=False, rtol=1e-6)
+
+
+def assert_same_order(expected: pd.DataFrame, actual: pd.DataFrame) -> None:
+    """
+    縦持ちデータが行順も含めて一致することを確認する(型はver2.2と同じ型に揃えて比較する)。
+    """
+    pd.testing.assert_frame_equal(to_reference_schema(expected).reset_index(drop=True),
+                                  to_reference_schema(actual).reset_index(drop=True),
+                                  check_exact=False, rtol=1e-6)
+
+
+def reorder_times(df: pd.DataFrame, case: str, seed: int = 0) -> pd.DataFrame:
+    """
+    横持ちデータのTIMEをcaseの並びに置き換える(TIME_ORDER_CASESのいずれか)。
+    """
+    if case == "ordered":
+        return df
+    rng = np.random.default_rng(seed)
+    times = df.iloc[:, 0].to_numpy().copy()
+    picked = rng.choice(len(times) - 1, size=max(1, len(times) // 20), replace=False)
+    if case == "duplicated":
+        times[picked + 1] = times[picked]
+    else:
+        times[picked], times[picked + 1] = times[picked + 1], times[picked].copy()
+    df = df.copy()
+    df.iloc[:, 0] = times
+    return df
+
+
+def time_call(func: Callable[[], object], repeat: int) -> float:
+    """
+    関数をrepeat回実行し、最短の実行時間[s]を返す。
+    """
+    best = float('inf')
+    for _ in range(repeat):
+        s_time = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - s_time)
+    return best
+
+
+def bench_scaling(node_ranges: List[Tuple[int, int]], n_rows: int, repeat: int) -> None:
+    """
+    ノード単位ループと一括変換エンジンの1ファイルあたりの処理時間を比較する。
+    """
+    df_scale, df_sens_type = load_settings()
+    scale_table = ScaleTable.from_frame(df_scale)
+    sens_table = SensTypeTable.from_frame(df_sens_type)
+    print(f"{'node range':>12} {'rows':>6} {'legacy[s]':>10} {'vectorized[s]':>14} {'speedup':>8}")
+    for start_node, end_node in node_ranges:
+        df = make_wide_frame(start_node, end_node, n_rows, df_scale, df_sens_type)
+        layout = get_node_layout(start_node, end_node)
+        expected = legacy_scale_by_sens_type(df, start_node, end_node, df_scale, df_sens_type)
+        actual = scale_wide_frame(df, layout, scale_table, sens_table).long
+        assert_same_order(expected, actual)
+        legacy_time = time_call(lambda: legacy_scale_file(df, start_node, end_node, df_scale, df_sens_type), repeat)
+        vectorized_time = time_call(lambda: scale_wide_frame(df, layout, scale_table, sens_table), repeat)
+        print(f"{f'node{start_node}-{end_node}':>12} {n_rows:>6} {legacy_time:>10.4f} "
+              f"{vectorized_time:>14.4f} {legacy_time / vectorized_time:>7.1f}x")
+
+
+def bench_time_order(node_ranges: List[Tuple[int, int]], n_rows: int, repeat: int) -> None:
+    """
+    縦持ちデータの行順が、ノードごとのmeltをTIMEで安定ソートした結果と一致することを確認し、
+    一括変換の処理時間と、ノード順に並んだ縦持ちデータ全体をTIMEで並べ替える処理時間(変更前の並べ替え)を比較する。
+    """
+    df_scale, df_sens_type = load_settings()
+    scale_table = ScaleTable.from_frame(df_scale)
+    sens_table = SensTypeTable.from_frame(df_sens_type)
+    print(f"{'node range':>12} {'times':>10} {'long rows':>10} {'scale[s]':>9} {'global sort[s]':>15}")
+    for start_node, end_node in node_ranges:
+        layout = get_node_layout(start_node, end_node)
+        for case in TIME_ORDER_CASES:
+            df = reorder_times(make_wide_frame(start_node, end_node, n_rows, df_scale, df_sens_type), case)
+            expected = legacy_scale_by_sens_type(df, start_node, end_node, df_scale, df_sens_type)
+            actual = scale_wide_frame(df, layout, scale_table, sens_table).long
+            assert_same_order(expected, actual)
+            scale_time = time_call(lambda: scale_wide_frame(df, layout, scale_table, sens_table), repeat)
+            node_major = actual.sort_values(by="ノードID", kind='stable')
+            sort_time = time_call(lambda: node_major.sort_values(by="TIME", kind='stable'), repeat)
+            print(f"{f'node{start_node}-{end_node}':>12} {case:>10} {len(actual):>10} {scale_time:>9.4f} "
+                  f"{sort_time:>15.4f}")
+    start_node, end_node = node_ranges[0]
+    check_invalid_times(start_node, end_node, n_rows, df_scale, df_sens_type, scale_table, sens_table)
+    print("TIMEが空・書式の異なる行: OK")
+
+
+def check_invalid_times(start_node: int, end_node: int, n_rows: int, df_scale: pd.DataFrame,
+                        df_sens_type: pd.DataFrame, scale_table: ScaleTable, sens_table: SensTypeTable) -> None:
+    """
+    TIMEが空・書式の異なる行を含むロガーCSVを、どの読み込み方式でもエラーにせずその行だけ除いて変換し、
+    除いた行数を返すこと、CSVに書き出すTIMEがロガーCSVに書かれていたままの文字列であることを確認する。
+    """
+    df = make_wide_frame(start_node, end_node, n_rows, df_scale, df_sens_type, empty_ratio=0)
+    bad_rows = [3, 5, 7]
+    df.iloc[bad_rows, 0] = ['', 'TIME', '2025-04-21T00:03:30']
+    # 0埋めのない時刻はロガーCSVの書式として読み込み、CSVには書かれていたまま出力する
+    df.iloc[9, 0] = df.iloc[9, 0].replace('/04/', '/4/')
+    expected = scale_wide_frame(df.drop(index=bad_rows).reset_index(drop=True), get_node_layout(start_node, end_node),
+                                scale_table, sens_table, shapes=("long", "wide"))
+    with tempfile.TemporaryDirectory() as work_dir:
+        file_path = os.path.join(work_dir, f'node{start_node}-{end_node}_invalid_time.CSV')
+        write_logger_csv(df, file_path)
+        data, _ = read_complete_lines(file_path, complete_only=False)
+        for backend in INGEST_BACKENDS:
+            layout = ingest_layout(start_node, end_node, backend, header=read_header(file_path))
+            actual = scale_wide_frame(parse_logger_bytes(data, True, backend, layout), layout,
+                                      scale_table, sens_table, shapes=("long", "wide"))
+            assert actual.invalid_time_rows == len(bad_rows)
+            assert_same_order(expected.long, actual.long)
+            assert (actual.long_time_text == expected.long_time_text).all()
+            assert "2025/4/21" in set(t[:9] for t in actual.long_time_text)
+            for sens_code, df_wide in expected.wide.items():
+                pd.testing.assert_frame_equal(df_wide, actual.wide[sens_code], check_dtype=False)
+                assert (actual.wide_time_text[sens_code] == expected.wide_time_text[sens_code]).all()
+
+
+def bench_sens_swap(node_ranges: List[Tuple[int, int]], n_rows: int, chunk_rows: int, repeat: int) -> None:
+    """
+    途中でセンサが交換されたノードの各行が、その行のセンサ種別の測定種別名で変換されることを確認する。
+    chunk_rows行ずつ変換した結果を連結したものが一括変換と一致すること(分割読み込み・追記処理で
+    測定種別名が変わらないこと)も確認し、センサ交換の有無による一括変換の処理時間を比較する。
+    """
+    df_scale, df_sens_type = load_settings()
+    scale_table = ScaleTable.from_frame(df_scale)
+    sens_table = SensTypeTable.from_frame(df_sens_type)
+    print(f"{'node range':>12} {'long rows':>10} {'constant[s]':>12} {'swapped[s]':>11}")
+    for start_node, end_node in node_ranges:
+        layout = get_node_layout(start_node, end_node)
+        df = make_wide_frame(start_node, end_node, n_rows, df_scale, df_sens_type)
+        df_swapped = swap_sensors(df, start_node, end_node, df_sens_type)
+        expected = legacy_scale_by_sens_type(df_swapped, start_node, end_node, df_scale, df_sens_type)
+        actual = scale_wide_frame(df_swapped, layout, scale_table, sens_table).long
+        assert_same_order(expected, actual)
+        chunks = [scale_wide_frame(df_swapped.iloc[pos:pos + chunk_rows], layout, scale_table, sens_table).long
+                  for pos in range(0, len(df_swapped), chunk_rows)]
+        assert_same_order(actual, pd.concat(chunks, ignore_index=True))
+        constant_time = time_call(lambda: scale_wide_frame(df, layout, scale_table, sens_table), repeat)
+        swapped_time = time_call(lambda: scale_wide_frame(df_swapped, layout, scale_table, sens_table), repeat)
+        print(f"{f'node{start_node}-{end_node}':>12} {len(actual):>10} {constant_time:>12.4f} {swapped_time:>11.4f}")
+
+
+def melt_wide_frames(wide: Dict[int, pd.DataFrame]) -> pd.DataFrame:
+    """
+    センサ種別ごとの横持ちデータを縦持ちデータに戻す(欠損値の行は除く)。
+    """
+    frames = [
+        df_wide.melt(id_vars=["TIME", "ノードID"], var_name="測定種別", value_name="測定値").dropna()
+        for df_wide in wide.values()
+    ]
+    if not frames:
+        return pd.DataFrame(columns=LONG_COLUMNS)
+    df_long = pd.concat(frames, ignore_index=True)
+    # 重複する測定種別名に付けた値の番号を外し、縦持ちデータと同じ名前に戻す
+    df_long["測定種別"] = df_long["測定種別"].astype(str).str.replace(DUPLICATE_NAME_PATTERN, '', regex=True)
+    return df_long
+
+
+def check_wide_parquet(start_node: int, end_node: int, n_rows: int, df_scale: pd.DataFrame,
+                       df_sens_type: pd.DataFrame, scale_table: ScaleTable, sens_table: SensTypeTable) -> None:
+    """
+    測定種別名が重複するセンサ種別(sens_code 29)を含む横持ちデータをParquet・CSVに書き出し、
+    読み戻して縦持ちに戻した結果が縦持ちデータと一致することを確認する。
+    """
+    df = make_wide_frame(start_node, end_node, n_rows, df_scale, df_sens_type, empty_ratio=0,
+                         sens_codes=[DUPLICATE_NAME_SENS_CODE, 9])
+    layout = get_node_layout(start_node, end_node)
+    scaled_file = scale_wide_frame(df, layout, scale_table, sens_table, shapes=("long", "wide"))
+    assert DUPLICATE_NAME_SENS_CODE in scaled_file.wide
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        wide = {}
+        for sens_code, df_wide in scaled_file.wide.items():
+            target = wide_output_target(tmp_dir, start_node, end_node, '20250421', sens_code)
+            write_long_frame(df_wide, target)
+            wide[sens_code] = pd.read_parquet(target.parquet_path)
+            assert list(pd.read_csv(target.csv_path, encoding=OUTPUT_CSV_ENCODING, nrows=0).columns) == list(df_wide.columns)
+    assert_same_long_frame(scaled_file.long, melt_wide_frames(wide))
+    print(f"測定種別名が重複するセンサ種別(sens_code {DUPLICATE_NAME_SENS_CODE})の横持ち出力: OK")
+
+
+def bench_wide(node_ranges: List[Tuple[int, int]], n_rows: int, repeat: int) -> None:
+    """
+    センサ種別ごとの横持ちデータを縦持ちに戻すと縦持ちデータと一致することを確認し、
+    縦持ち・横持ちの作成時間と行数を比較する。横持ちが必要な場合に縦持ちから
+    pivotし直す時間(変更前の利用方法)も表示する。
+    """
+    df_scale, df_sens_type = load_settings()
+    scale_table = ScaleTable.from_frame(df_scale)
+    sens_table = SensTypeTable.from_frame(df_sens_type)
+    print(f"{'node range':>12} {'long rows':>10} {'wide rows':>10} {'tables':>7} "
+          f"{'long[s]':>8} {'wide[s]':>8} {'pivot[s]':>9}")
+    for start_node, end_node in node_ranges:
+        df = make_wide_frame(start_node, end_node, n_rows, df_scale, df_sens_type)
+        layout = get_node_layout(start_node, end_node)
+        scaled_file = scale_wide_frame(df, layout, scale_table, sens_table, shapes=("long", "wide"))
+        assert_same_long_frame(scaled_file.long, melt_wide_frames(scaled_file.wide))
+        long_time = time_call(lambda: scale_wide_frame(df, layout, scale_table, sens_table, shapes=("long",)), repeat)
+        wide_time = time_call(lambda: scale_wide_frame(df, layout, scale_table, sens_table, shapes=("wide",)), repeat)
+        df_long = scaled_file.long
+        pivot_time = time_call(lambda: df_long.pivot_table(index=["TIME", "ノードID"], columns="測定種別",
+                                                          values="測定値", observed=True), repeat)
+        wide_rows = sum(len(df_wide) for df_wide in scaled_file.wide.values())
+        print(f"{f'node{start_node}-{end_node}':>12} {len(df_long):>10} {wide_rows:>10} "
+              f"{len(scaled_file.wide):>7} {long_time:>8.4f} {wide_time:>8.4f} {pivot_time:>9.4f}")
+    start_node, end_node = node_ranges[0]
+    check_wide_parquet(start_node, end_node, n_rows, df_scale, df_sens_type, scale_table, sens_table)
+
+
+def bench_sens_type_lookup(repeat: int) -> None:
+    """
+    sens_type.jsonの全コードについて、DataFrameの絞り込みと変換済みテーブルの参照コストを比較する。
+    """
+    _, df_sens_type = load_settings()
+    sens_table = SensTypeTable.from_frame(df_sens_type)
+    codes = df_sens_type['sens_code_dec'].dropna().tolist()
+
+    def legacy_lookup():
+        for code in codes:
+            df_filtered_sens_type = df_sens_type[df_sens_type['sens_code_dec'] == code]
+            list(filter(lambda x: not pd.isna(x), df_filtered_sens_type.values.flatten().tolist()))[3:]
+
+    def table_lookup():
+        for code in codes:
+            sens_table.lookup(code)
+
+    def vectorized_lookup():
+        index = sens_table.code_index(np.array(codes))
+        sens_table.names[index], sens_table.counts[index]
+
+    for code in codes:
+        legacy_names = list(filter(lambda x: not pd.isna(x), df_sens_type[df_sens_type['sens_code_dec'] == code].values.flatten().tolist()))[3:]
+        assert list(sens_table.lookup(code)) == legacy_names, code
+    print(f"{len(codes)} codes, best of {repeat}")
+    print(f"{'method':>12} {'total[us]':>10} {'per code[us]':>13}")
+    for label, func in [("DataFrame", legacy_lookup), ("table", table_lookup), ("vectorized", vectorized_lookup)]:
+        elapsed = time_call(func, repeat) * 1e6
+        print(f"{label:>12} {elapsed:>10.1f} {elapsed / len(codes):>13.2f}")
+
+
+def bench_dtypes(node_ranges: List[Tuple[int, int]], n_rows: int, repeat: int) -> None:
+    """
+    縦持ちデータの型(測定値はfloat32/float64)とver2.2と同じ型について、
+    内容が一致することを確認し、メモリ使用量とParquetの書き出し時間・サイズを比較する。
+    """
+    df_scale, df_sens_type = load_settings()
+    scale_table = ScaleTable.from_frame(df_scale)
+    sens_table = SensTypeTable.from_frame(df_sens_type)
+    print(f"{'node range':>12} {'schema':>10} {'memory[MB]':>11} {'parquet[s]':>11} {'parquet[KB]':>12}")
+    with tempfile.TemporaryDirectory() as work_dir:
+        for start_node, end_node in node_ranges:
+            df = make_wide_frame(start_node, end_node, n_rows, df_scale, df_sens_type)
+            layout = get_node_layout(start_node, end_node)
+            frames = {
+                value_dtype: scale_wide_frame(df, layout, scale_table, sens_table, value_dtype=value_dtype).long
+                for value_dtype in VALUE_DTYPES
+            }
+            frames["reference"] = to_reference_schema(frames["float64"])
+            for schema, df_long in frames.items():
+                assert_same_long_frame(frames["reference"], df_long)
+                parquet_path = os.path.join(work_dir, f'{schema}.parquet')
+                elapsed = time_call(lambda: df_long.to_parquet(parquet_path, index=False), repeat)
+                memory = df_long.memory_usage(deep=True).sum() / 1024 / 1024
+                print(f"{f'node{start_node}-{end_node}':>12} {schema:>10} {memory:>11.2f} {elapsed:>11.4f} "
+                      f"{os.path.getsize(parquet_path) / 1024:>12.1f}")
+
+
+def bench_ingest(files: List[Tuple[str, int, int]], repeat: int) -> None:
+    """
+    読み込み方式ごとに、ロガーCSVの読み込み時間と読み込んだDataFrameのメモリ使用量を比較する。
+    スケール変換の結果(縦持ちデータと最新値)が読み込み方式によらず一致することも確認する。
+    """
+    df_scale, df_sens_type = load_settings()
+    scale_table = ScaleTable.from_frame(df_scale)
+    sens_table = SensTypeTable.from_frame(df_sens_type)
+    print(f"{'file':>28} {'backend':>8} {'columns':>8} {'read[s]':>8} {'memory[MB]':>11}")
+    for file_path, start_node, end_node in files:
+        data, _ = read_complete_lines(file_path, complete_only=False)
+        expected = None
+        for backend in INGEST_BACKENDS:
+            layout = ingest_layout(start_node, end_node, backend)
+            df = parse_logger_bytes(data, True, backend, layout)
+            scaled_file = scale_wide_frame(df, layout, scale_table, sens_table)
+            if expected is None:
+                expected = scaled_file
+            else:
+                assert_same_order(expected.long, scaled_file.long)
+                pd.testing.assert_frame_equal(pd.DataFrame(expected.latest_rows), pd.DataFrame(scaled_file.latest_rows),
+                                              check_dtype=False)
+            elapsed = time_call(lambda: parse_logger_bytes(data, True, backend, layout), repeat)
+            memory = df.memory_usage(deep=True).sum() / 1024 / 1024
+            print(f"{os.path.basename(file_path):>28} {backend:>8} {df.shape[1]:>8} {elapsed:>8.4f} {memory:>11.2f}")
+    for start_node, end_node in sorted({(start_node, end_node) for _, start_node, end_node in files}):
+        check_empty_file(start_node, end_node, scale_table, sens_table)
+    print("データ行のないファイル: OK")
+    start_node, end_node = files[0][1], files[0][2]
+    check_latest_duplicate_names(start_node, end_node, scale_table, sens_table)
+    print(f"測定種別名が重複するセンサ種別(sens_code {DUPLICATE_NAME_SENS_CODE})の最新値: OK")
+
+
+def check_empty_file(start_node: int, end_node: int, scale_table: ScaleTable, sens_table: SensTypeTable) -> None:
+    """
+    カラム名行だけでデータ行のないロガーCSV(日付が変わった直後の当日分など)を、どの読み込み方式でも
+    一括・分割のどちらの読み込みでもエラーにせず、出力なしとして扱えることを確認する。
+    """
+    df_scale, df_sens_type = load_settings()
+    df_empty = make_wide_frame(start_node, end_node, 1, df_scale, df_sens_type).iloc[:0]
+    with tempfile.TemporaryDirectory() as work_dir:
+        file_path = os.path.join(work_dir, f'node{start_node}-{end_node}_empty.CSV')
+        write_logger_csv(df_empty, file_path)
+        data, _ = read_complete_lines(file_path, complete_only=False)
+        for backend in INGEST_BACKENDS:
+            layout = ingest_layout(start_node, end_node, backend, header=read_header(file_path))
+            frames = [parse_logger_bytes(data, True, backend, layout)]
+            frames += list(iter_logger_csv(file_path, 10, backend, layout))
+            for df in frames:
+                scaled_file = scale_wide_frame(df, layout, scale_table, sens_table, shapes=("long", "wide"))
+                assert len(scaled_file.long) == 0 and list(scaled_file.long.columns) == LONG_COLUMNS
+                assert scaled_file.wide == {} and scaled_file.latest_rows == []
+
+
+def check_latest_duplicate_names(start_node: int, end_node: int, scale_table: ScaleTable,
+                                 sens_table: SensTypeTable) -> None:
+    """
+    測定種別名が重複するセンサ種別(sens_code 29)のノードについて、最新値がどの読み込み方式でも
+    横持ちデータのノードごとの最終行と一致し(重複する名前の値が上書きされない)、
+    最新値の記録(LatestValueStore)に書き込んで読み戻しても変わらないことを確認する。
+    """
+    df_scale, df_sens_type = load_settings()
+    df = make_wide_frame(start_node, end_node, 50, df_scale, df_sens_type, empty_ratio=0,
+                         sens_codes=[DUPLICATE_NAME_SENS_CODE])
+    with tempfile.TemporaryDirectory() as work_dir:
+        file_path = os.path.join(work_dir, f'node{start_node}-{end_node}_sens{DUPLICATE_NAME_SENS_CODE}.CSV')
+        write_logger_csv(df, file_path)
+        data, _ = read_complete_lines(file_path, complete_only=False)
+        for backend in INGEST_BACKENDS:
+            layout = ingest_layout(start_node, end_node, backend, header=read_header(file_path))
+            scaled_file = scale_wide_frame(parse_logger_bytes(data, True, backend, layout), layout,
+                                           scale_table, sens_table, shapes=("wide",))
+            df_wide = scaled_file.wide[DUPLICATE_NAME_SENS_CODE]
+            expected = (df_wide.groupby("ノードID").tail(1).sort_values("ノードID")
+                        .drop(columns="TIME").reset_index(drop=True))
+            actual = pd.DataFrame(scaled_file.latest_rows).drop(columns="TIME")
+            assert list(actual.columns) == list(expected.columns)
+            pd.testing.assert_frame_equal(expected, actual, check_dtype=False, check_exact=False, rtol=1e-6)
+            with LatestValueStore(os.path.join(work_dir, f'latest_values_{backend}.db')) as latest_values:
+                latest_values.update('20250421', scaled_file.latest_rows)
+                stored = pd.DataFrame(latest_values.rows('20250421')).drop(columns="TIME")
+            pd.testing.assert_frame_equal(actual, stored, check_dtype=False)
+
+
+def bench_sparse_nodes(files: List[Tuple[str, int, int]], sample_rows: int, repeat: int) -> None:
+    """
+    事前確認でデータのあるノードだけを読み込んだ場合と全ノードを読み込んだ場合について、
+    読み込み+スケール変換の時間を比較し、縦持ちデータが一致することを確認する。
+    事前確認で検出できなかったノード(サンプルに含まれない行にだけデータがあるノード)の数も表示する。
+    """
+    df_scale, df_sens_type = load_settings()
+    scale_table = ScaleTable.from_frame(df_scale)
+    sens_table = SensTypeTable.from_frame(df_sens_type)
+    print(f"{'file':>28} {'backend':>8} {'nodes':>6} {'missed':>7} {'prescan[s]':>11} "
+          f"{'all nodes[s]':>13} {'sparse[s]':>10}")
+    for file_path, start_node, end_node in files:
+        data, _ = read_complete_lines(file_path, complete_only=False)
+        full_layout = get_node_layout(start_node, end_node)
+        nodes = sample_populated_nodes(file_path, full_layout, sample_rows)
+        prescan_time = time_call(lambda: sample_populated_nodes(file_path, full_layout, sample_rows), repeat)
+        for backend in INGEST_BACKENDS:
+            layout = ingest_layout(start_node, end_node, backend)
+            sparse_layout = ingest_layout(start_node, end_node, backend, nodes)
+
+            def run(run_layout):
+                df = parse_logger_bytes(data, True, backend, run_layout)
+                return scale_wide_frame(df, run_layout, scale_table, sens_table)
+
+            expected = run(layout)
+            missed = set(expected.populated_nodes) - nodes
+            if not missed:
+                assert_same_order(expected.long, run(sparse_layout).long)
+            all_time = time_call(lambda: run(layout), repeat)
+            sparse_time = time_call(lambda: run(sparse_layout), repeat)
+            print(f"{os.path.basename(file_path):>28} {backend:>8} {f'{len(nodes)}/{full_layout.n_nodes}':>6} "
+                  f"{len(missed):>7} {prescan_time:>11.4f} {all_time:>13.4f} {sparse_time:>10.4f}")
+
+
+def header_case_frame(df: pd.DataFrame, start_node: int, end_node: int,
+                      case: str) -> Tuple[pd.DataFrame, int, int]:
+    """
+    横持ちデータをcase(HEADER_CASESのいずれか)の形に変え、そのファイルを置くフォルダのノードID範囲と合わせて返す。
+    """
+    if case == "reordered":
+        blocks = [df.iloc[:, 1 + i * NODE_BLOCK_WIDTH:1 + (i + 1) * NODE_BLOCK_WIDTH]
+                  for i in range(end_node - start_node + 1)]
+        df = pd.concat([df.iloc[:, :1]] + blocks[::-1] + [pd.Series("-", index=df.index, name="備考")], axis=1)
+        return df, start_node, end_node
+    if case == "subset":
+        return df, start_node, end_node + 5
+    if case == "unnamed":
+        df = pd.concat([df, pd.Series("-", index=df.index, name="備考")], axis=1)
+        df.columns = [f"CH{pos}" for pos in range(df.shape[1])]
+        return df, start_node, end_node
+    df = df.copy()
+    df.columns = [name.split(':')[-1] for name in df.columns]
+    return df, start_node, end_node
+
+
+def bench_header_layout(node_ranges: List[Tuple[int, int]], n_rows: int, repeat: int) -> None:
+    """
+    カラム名行から求めたカラム配置で、フォルダ名と異なる形のロガーCSVを正しく読み込めることを確認し、
+    カラム名の解析とキャッシュされた配置の取得の時間を比較する。
+    """
+    df_scale, df_sens_type = load_settings()
+    scale_table = ScaleTable.from_frame(df_scale)
+    sens_table = SensTypeTable.from_frame(df_sens_type)
+    print(f"{'nodes':>8} {'case':>10} {'parse[s]':>10} {'cached[s]':>10}")
+    with tempfile.TemporaryDirectory() as work_dir:
+        for start_node, end_node in node_ranges:
+            df = make_wide_frame(start_node, end_node, n_rows, df_scale, df_sens_type)
+            layout = get_node_layout(start_node, end_node)
+            expected = scale_wide_frame(df, layout, scale_table, sens_table).long
+            for case in HEADER_CASES:
+                df_case, folder_start, folder_end = header_case_frame(df, start_node, end_node, case)
+                file_path = os.path.join(work_dir, f'{case}.CSV')
+                write_logger_csv(df_case, file_path)
+                data, _ = read_complete_lines(file_path, complete_only=False)
+                header = read_header(file_path)
+                for backend in INGEST_BACKENDS:
+                    case_layout = ingest_layout(folder_start, folder_end, backend, header=header)
+                    actual = scale_wide_frame(parse_logger_bytes(data, True, backend, case_layout), case_layout,
+                                              scale_table, sens_table).long
+                    # ノードの並びが変わる場合は同じ時刻の行の順序が変わる
+                    assert_same_long_frame(expected, actual)
+                    if case != "reordered":
+                        assert_same_order(expected, actual)
+                columns = tuple(df_case.columns)
+                parse_time = time_call(lambda: layout_from_header(columns, folder_start, folder_end), repeat)
+                cached_time = time_call(
+                    lambda: header_layout(read_header(file_path), folder_start, folder_end), repeat
+                )
+                print(f"{f'{start_node}-{end_node}':>8} {case:>10} {parse_time:>10.5f} {cached_time:>10.5f}")
+            # ノードIDのカラムがなくカラム数が足りない場合はエラーにする
+            short_columns = [f"CH{pos}" for pos in range(layout.n_columns - 1)]
+            try:
+                layout_from_header(short_columns, start_node, end_node)
+            except ValueError:
+                pass
+            else:
+                raise AssertionError("layout_from_header accepted a header with too few columns")
+
+
+def bench_scan(n_folders: int, n_files: int, repeat: int) -> None:
+    """
+    ロガーフォルダのスキャンについて、一覧を取り直す場合とキャッシュした一覧を確認する場合の時間を比較する。
+    処理済みのファイルを同じ名前のまま書き換えた場合(フォルダの更新日時は変わらない)に、
+    キャッシュした一覧の確認でそのファイルを検出できることも確認する。
+    """
+    with tempfile.TemporaryDirectory() as work_dir:
+        log_dir = os.path.join(work_dir, 'LoggingLog')
+        folders = []
+        file_paths = []
+        for i in range(n_folders):
+            node_range = f'node{i * 20 + 1}-{i * 20 + 20}'
+            folder = os.path.join(log_dir, node_range)
+            os.makedirs(folder)
+            folders.append(folder)
+            for day in range(n_files):
+                yyyymmdd = (datetime(2025, 4, 21) + timedelta(days=day)).strftime('%Y%m%d')
+                file_path = os.path.join(folder, f'{node_range}_{yyyymmdd}.CSV')
+                with open(file_path, 'wb') as f:
+                    f.write(b'TIME\r\n')
+                file_paths.append(file_path)
+        # 更新日時が直前のフォルダは毎回一覧を取り直すため、フォルダの更新日時を過去にする
+        past = time.time() - 60
+        for folder in folders:
+            os.utime(folder, (past, past))
+        processed = set(file_paths)
+        is_pending = lambda file_path: file_path not in processed
+        with LogFolderScanner(os.path.join(work_dir, 'scan.db'), log_dir) as scanner:
+            rescan_time = time_call(lambda: scanner.scan(is_pending), 1)
+            cached_time = time_call(lambda: scanner.scan(is_pending), repeat)
+            assert scanner.scan(is_pending) == []
+            rewritten = file_paths[len(file_paths) // 2]
+            with open(rewritten, 'ab') as f:
+                f.write(b'2025/04/21 00:00:00\r\n')
+            scanned_files = scanner.scan(is_pending)
+            assert [(scanned.file_path, scanned.changed) for scanned in scanned_files] == [(rewritten, True)]
+            assert scanner.scan(is_pending) == []
+    print(f"{'folders':>8} {'files':>8} {'rescan[s]':>10} {'cached[s]':>10}")
+    print(f"{n_folders:>8} {len(file_paths):>8} {rescan_time:>10.4f} {cached_time:>10.4f}")
+    print("処理済みのファイルの書き換え: OK")
+
+
+def bench_pipeline(files: List[Tuple[str, int, int]], output_dir: str, output_mode: str = "files",
+                   write_csv: bool = True, ingest: str = "pandas") -> Dict[str, Dict[str, float]]:
+    """
+    ファイルごとに読み込み・スケール変換(TIME順の縦持ちデータまで)・書き出しを行い、段階ごとの
+    処理時間と最大RSSを集計する。最大RSSは段階ごとにリセットできる場合はその段階の最大値、
+    できない場合はプロセス開始からの最大値となる。
+    """
+    df_scale, df_sens_type = load_settings()
+    scale_table = ScaleTable.from_frame(df_scale)
+    sens_table = SensTypeTable.from_frame(df_sens_type)
+    seconds = dict.fromkeys(PIPELINE_STAGES, 0.0)
+    peaks = dict.fromkeys(PIPELINE_STAGES, 0)
+    total_rows = 0
+    long_rows = 0
+
+    def run_stage(stage: str, func: Callable[[], object]) -> object:
+        reset_peak_rss()
+        s_time = time.perf_counter()
+        result = func()
+        seconds[stage] += time.perf_counter() - s_time
+        peaks[stage] = max(peaks[stage], peak_rss())
+        return result
+
+    for file_path, start_node, end_node in files:
+        yyyymmdd = os.path.splitext(os.path.basename(file_path))[0].split('_')[-1]
+        layout = ingest_layout(start_node, end_node, ingest)
+        target = output_target(output_dir, start_node, end_node, yyyymmdd, output_mode, write_csv)
+        df = run_stage("read", lambda: parse_logger_bytes(read_complete_lines(file_path, complete_only=False)[0],
+                                                          True, ingest, layout))
+        scaled_file = run_stage("scale", lambda: scale_wide_frame(df, layout, scale_table, sens_table))
+        df_long = scaled_file.long
+        run_stage("write", lambda: write_long_frame(df_long, target))
+        total_rows += len(df)
+        long_rows += len(df_long)
+
+    results = {}
+    for stage in PIPELINE_STAGES:
+        elapsed = seconds[stage]
+        results[stage] = {
+            "seconds": elapsed,
+            "files_per_sec": len(files) / elapsed if elapsed else float('inf'),
+            "rows_per_sec": total_rows / elapsed if elapsed else float('inf'),
+            "peak_rss_mb": peaks[stage] / 1024 / 1024,
+        }
+    total = sum(seconds.values())
+    results["total"] = {
+        "seconds": total,
+        "files_per_sec": len(files) / total if total else float('inf'),
+        "rows_per_sec": total_rows / total if total else float('inf'),
+        "peak_rss_mb": max(peaks.values()) / 1024 / 1024,
+    }
+    print(f"{len(files)} files, {total_rows} rows, {long_rows} long rows")
+    return results
+
+
+def print_pipeline_results(results: Dict[str, Dict[str, float]],
+                           baseline: Optional[Dict[str, Dict[str, float]]] = None,
+                           tolerance: float = 0.2) -> bool:
+    """
+    段階ごとの結果を表示する。baselineを指定した場合、処理速度(rows/s)がtoleranceの割合を
+    超えて低下した段階を表示し、低下がなければTrueを返す。
+    """
+    ok = True
+    print(f"{'stage':>6} {'time[s]':>9} {'files/s':>9} {'rows/s':>11} {'peak RSS[MB]':>13} {'vs baseline':>12}")
+    for stage, result in results.items():
+        line = (f"{stage:>6} {result['seconds']:>9.3f} {result['files_per_sec']:>9.2f} "
+                f"{result['rows_per_sec']:>11.0f} {result['peak_rss_mb']:>13.1f}")
+        if baseline and stage in baseline:
+            ratio = result['rows_per_sec'] / baseline[stage]['rows_per_sec']
+            regressed = ratio < 1 - tolerance
+            ok = ok and not regressed
+            line += f" {ratio:>11.2f}x" + (" REGRESSION" if regressed else "")
+        print(line)
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description="WSN前処理のベンチマーク")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    scaling_parser = subparsers.add_parser("scaling", help="スケール変換(ノード単位ループと一括変換)の比較")
+    scaling_parser.add_argument("--nodes", nargs="+", default=["1-17", "18-20"],
+                                help="ノードID範囲(例: 1-17)")
+    scaling_parser.add_argument("--rows", type=int, default=2880, help="1ファイルあたりの行数")
+    scaling_parser.add_argument("--repeat", type=int, default=3, help="計測の繰り返し回数")
+    dtypes_parser = subparsers.add_parser("dtypes", help="縦持ちデータの型によるメモリ使用量・Parquetサイズの比較")
+    dtypes_parser.add_argument("--nodes", nargs="+", default=["1-17", "18-20"], help="ノードID範囲(例: 1-17)")
+    dtypes_parser.add_argument("--rows", type=int, default=2880, help="1ファイルあたりの行数")
+    dtypes_parser.add_argument("--repeat", type=int, default=3, help="計測の繰り返し回数")
+    time_order_parser = subparsers.add_parser("time-order", help="縦持ちデータの行順の確認と並べ替えのコストの比較")
+    time_order_parser.add_argument("--nodes", nargs="+", default=["1-17", "18-20"], help="ノードID範囲(例: 1-17)")
+    time_order_parser.add_argument("--rows", type=int, default=2880, help="1ファイルあたりの行数")
+    time_order_parser.add_argument("--repeat", type=int, default=3, help="計測の繰り返し回数")
+    wide_parser = subparsers.add_parser("wide", help="センサ種別ごとの横持ちデータの確認と作成時間の比較")
+    wide_parser.add_argument("--nodes", nargs="+", default=["1-17", "18-20"], help="ノードID範囲(例: 1-17)")
+    wide_parser.add_argument("--rows", type=int, default=2880, help="1ファイルあたりの行数")
+    wide_parser.add_argument("--repeat", type=int, default=3, help="計測の繰り返し回数")
+    header_parser = subparsers.add_parser("header", help="カラム名行から求めるカラム配置の確認")
+    header_parser.add_argument("--nodes", nargs="+", default=["1-17", "18-20"], help="ノードID範囲(例: 1-17)")
+    header_parser.add_argument("--rows", type=int, default=2880, help="1ファイルあたりの行数")
+    header_parser.add_argument("--repeat", type=int, default=3, help="計測の繰り返し回数")
+    sens_swap_parser = subparsers.add_parser("sens-swap", help="途中でセンサが交換されたノードの変換の確認")
+    sens_swap_parser.add_argument("--nodes", nargs="+", default=["1-17", "18-20"], help="ノードID範囲(例: 1-17)")
+    sens_swap_parser.add_argument("--rows", type=int, default=2880, help="1ファイルあたりの行数")
+    sens_swap_parser.add_argument("--chunk-rows", type=int, default=500, help="分割して変換する場合の行数")
+    sens_swap_parser.add_argument("--repeat", type=int, default=3, help="計測の繰り返し回数")
+    sens_type_parser = subparsers.add_parser("sens-type", help="センサ種別コードから測定種別名を引くコストの比較")
+    sens_type_parser.add_argument("--repeat", type=int, default=100, help="計測の繰り返し回数")
+    scan_parser = subparsers.add_parser("scan", help="ロガーフォルダのスキャン時間と書き換えの検出の確認")
+    scan_parser.add_argument("--folders", type=int, default=20, help="ノードフォルダ数")
+    scan_parser.add_argument("--files", type=int, default=365, help="ノードフォルダあたりのファイル数")
+    scan_parser.add_argument("--repeat", type=int, default=3, help="計測の繰り返し回数")
+
+    def add_data_arguments(subparser: argparse.ArgumentParser) -> None:
+        subparser.add_argument("--nodes", nargs="+", default=["1-17", "18-20"], help="ノードID範囲(例: 1-17)")
+        subparser.add_argument("--days", type=int, default=3, help="日数(ノード範囲ごとのファイル数)")
+        subparser.add_argument("--rows", type=int, default=2880, help="1ファイルあたりの行数")
+        subparser.add_argument("--empty-ratio", type=float, default=0.3, help="データのないノードの割合")
+        subparser.add_argument("--sensor-codes", type=int, nargs="+",
+                               help="使うセンサ種別コード(省略時はsens_type.jsonの全コード)")
+        subparser.add_argument("--seed", type=int, default=0, help="乱数のシード")
+
+    generate_parser = subparsers.add_parser("generate", help="合成したロガーCSVを書き出す")
+    generate_parser.add_argument("output_dir", help="出力先(LoggingLogと同じ構成で書き出す)")
+    add_data_arguments(generate_parser)
+    pipeline_parser = subparsers.add_parser("pipeline", help="合成データで前処理の段階ごとの性能を計測する")
+    add_data_arguments(pipeline_parser)
+    pipeline_parser.add_argument("--data", help="合成せずにこのフォルダ(generateの出力)のロガーCSVを使う")
+    pipeline_parser.add_argument("--output-mode", choices=OUTPUT_MODES, default="files", help="出力方式")
+    pipeline_parser.add_argument("--skip-csv", action="store_true", help="shift-jisのCSVを出力しない")
+    pipeline_parser.add_argument("--ingest", choices=INGEST_BACKENDS, default="pandas", help="ロガーCSVの読み込み方式")
+    sparse_parser = subparsers.add_parser("sparse-nodes", help="データのあるノードだけを読み込む場合の比較")
+    add_data_arguments(sparse_parser)
+    sparse_parser.add_argument("--data", help="合成せずにこのフォルダ(generateの出力)のロガーCSVを使う")
+    sparse_parser.add_argument("--sample-rows", type=int, default=DEFAULT_SAMPLE_ROWS, help="事前に確認するデータ行数")
+    sparse_parser.add_argument("--repeat", type=int, default=3, help="計測の繰り返し回数")
+    ingest_parser = subparsers.add_parser("ingest", help="ロガーCSVの読み込み方式(pandas/arrow)の比較")
+    add_data_arguments(ingest_parser)
+    ingest_parser.add_argument("--data", help="合成せずにこのフォルダ(generateの出力)のロガーCSVを使う")
+    ingest_parser.add_argument("--repeat", type=int, default=3, help="計測の繰り返し回数")
+    pipeline_parser.add_argument("--save", help="結果をJSONで保存する")
+    pipeline_parser.add_argument("--baseline", help="比較する結果JSON(--saveで保存したもの)")
+    pipeline_parser.add_argument("--tolerance", type=float, default=0.2,
+                                 help="処理速度の低下をREGRESSIONとする割合")
+    args = parser.parse_args()
+    if args.command == "scaling":
+        bench_scaling([parse_node_range(r) for r in args.nodes], args.rows, args.repeat)
+    elif args.command == "dtypes":
+        bench_dtypes([parse_node_range(r) for r in args.nodes], args.rows, args.repeat)
+    elif args.command == "time-order":
+        bench_time_order([parse_node_range(r) for r in args.nodes], args.rows, args.repeat)
+    elif args.command == "wide":
+        bench_wide([parse_node_range(r) for r in args.nodes], args.rows, args.repeat)
+    elif args.command == "header":
+        bench_header_layout([parse_node_range(r) for r in args.nodes], args.rows, args.repeat)
+    elif args.command == "sens-swap":
+        bench_sens_swap([parse_node_range(r) for r in args.nodes], args.rows, args.chunk_rows, args.repeat)
+    elif args.command == "sens-type":
+        bench_sens_type_lookup(args.repeat)
+    elif args.command == "scan":
+        bench_scan(args.folders, args.files, args.repeat)
+    elif args.command == "generate":
+        files = generate_logger_files(args.output_dir, [parse_node_range(r) for r in args.nodes], args.days,
+                                      args.rows, args.empty_ratio, args.seed, args.sensor_codes)
+        print(f"{len(files)} files written to {args.output_dir}")
+    elif args.command == "pipeline":
+        with tempfile.TemporaryDirectory() as work_dir:
+            if args.data:
+                files = find_logger_files(args.data)
+            else:
+                # 生成時のメモリが計測に含まれないよう、別プロセスで生成する
+                with ProcessPoolExecutor(max_workers=1) as executor:
+                    files = executor.submit(
+                        generate_logger_files, os.path.join(work_dir, 'LoggingLog'),
+                        [parse_node_range(r) for r in args.nodes], args.days, args.rows,
+                        args.empty_ratio, args.seed, args.sensor_codes
+                    ).result()
+            results = bench_pipeline(files, os.path.join(work_dir, 'output'), args.output_mode, not args.skip_csv,
+                                     args.ingest)
+        baseline = None
+        if args.baseline:
+            with open(args.baseline, 'r', encoding='utf-8') as f:
+                baseline = json.load(f)
+        ok = print_pipeline_results(results, baseline, args.tolerance)
+        if args.save:
+            with open(args.save, 'w', encoding='utf-8') as f:
+                json.dump(results, f, indent=2)
+        if not ok:
+            sys.exit(1)
+    elif args.command in ("ingest", "sparse-nodes"):
+        with tempfile.TemporaryDirectory() as work_dir:
+            if args.data:
+                files = find_logger_files(args.data)
+            else:
+                files = generate_logger_files(os.path.join(work_dir, 'LoggingLog'),
+                                              [parse_node_range(r) for r in args.nodes], args.days, args.rows,
+                                              args.empty_ratio, args.seed, args.sensor_codes)
+            if args.command == "ingest":
+                bench_ingest(files, args.repeat)
+            else:
+                bench_sparse_nodes(files, args.sample_rows, args.repeat)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,97 @@
+from typing import Dict, Tuple
+
+import numpy as np
+import pandas as pd
+
+# sens_type.jsonのうち測定種別名ではない項目
+SENS_TYPE_META_COLUMNS = ("sens_code_dec", "sens_code_hex", "sens_type")
+
+
+class SensTypeTable:
+    """
+    sens_type.jsonをセンサ種別コードで直接引ける形に変換したもの。
+    names[code]にそのコードの測定種別名(順序付き)、counts[code]にその数を持つ。
+    定義のないコードは測定種別なし(空のタプル、0件)として扱う。
+    """
+
+    def __init__(self, names_by_code: Dict[int, Tuple[str, ...]]) -> None:
+        size = max(names_by_code, default=-1) + 1
+        self.names_by_code = names_by_code
+        self.names = np.empty(size, dtype=object)
+        self.names[:] = [names_by_code.get(code, ()) for code in range(size)]
+        self.counts = np.array([len(names) for names in self.names], dtype=np.int64)
+
+    @classmethod
+    def from_frame(cls, df_sens_type: pd.DataFrame) -> "SensTypeTable":
+        """
+        pd.read_jsonで読み込んだsens_type.jsonから作成する。
+        同じコードが複数定義されている場合は先の定義を使う。
+        """
+        name_columns = [col for col in df_sens_type.columns if col not in SENS_TYPE_META_COLUMNS]
+        names_by_code = {}
+        for code, row in zip(df_sens_type['sens_code_dec'], df_sens_type[name_columns].itertuples(index=False)):
+            if pd.isna(code) or code < 0 or code != int(code):
+                continue
+            names_by_code.setdefault(int(code), tuple(name for name in row if not pd.isna(name)))
+        return cls(names_by_code)
+
+    def code_index(self, sens_codes: np.ndarray) -> np.ndarray:
+        """
+        センサ種別コード配列をnames/countsの添字に変換する。定義のないコードは-1とする。
+        """
+        sens_codes = np.asarray(sens_codes, dtype=np.float64)
+        index = np.full(sens_codes.shape, -1, dtype=np.intp)
+        with np.errstate(invalid='ignore'):
+            valid = (sens_codes >= 0) & (sens_codes < len(self.names)) & (sens_codes == np.floor(sens_codes))
+        index[valid] = sens_codes[valid].astype(np.intp)
+        return index
+
+    def lookup(self, sens_code: float) -> Tuple[str, ...]:
+        """
+        センサ種別コードに対応する測定種別名を返す。
+        """
+        if pd.isna(sens_code) or not float(sens_code).is_integer():
+            return ()
+        return self.names_by_code.get(int(sens_code), ())
+
+
+class ScaleTable:
+    """
+    wsn_scale.jsonをスケールコード(scale_code_dec)を添字とする倍率の配列に変換したもの。
+    定義のないコードは倍率NaNとし、decodeで件数を数えられるようにする。
+    """
+
+    def __init__(self, scale_by_code: Dict[int, float]) -> None:
+        size = max(scale_by_code, default=-1) + 1
+        self.scale_by_code = scale_by_code
+        self.factors = np.full(size, np.nan)
+        self.defined = np.zeros(size, dtype=bool)
+        for code, scale in scale_by_code.items():
+            self.factors[code] = scale
+            self.defined[code] = True
+
+    @classmethod
+    def from_frame(cls, df_scale: pd.DataFrame) -> "ScaleTable":
+        """
+        wsn_scale.jsonを読み込んだDataFrameから作成する。
+        """
+        return cls({
+            int(code): float(scale)
+            for code, scale in zip(df_scale['scale_code_dec'], df_scale['scale'])
+        })
+
+    def decode(self, scale_codes: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        スケールコード配列を倍率配列に変換する。
+        Returns:
+            Tuple[np.ndarray, np.ndarray]: 倍率(欠損・未定義のコードはNaN)と、未定義のコードの位置
+        """
+        factors = np.full(scale_codes.shape, np.nan)
+        with np.errstate(invalid='ignore'):
+            in_range = (scale_codes >= 0) & (scale_codes < len(self.factors)) & (scale_codes == np.floor(scale_codes))
+        index = scale_codes[in_range].astype(np.intp)
+        factors[in_range] = self.factors[index]
+        defined = np.zeros(scale_codes.shape, dtype=bool)
+        defined[in_range] = self.defined[index]
+        unknown = ~defined & ~np.isnan(scale_codes)
+        return factors, unknown
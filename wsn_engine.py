@@ -0,0 +1,274 @@
+from typing import Any, Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+from wsn_decoder import ScaleTable, SensTypeTable
+from wsn_layout import NODE_HEADER_FIELDS, VALUE_SLOTS, NodeLayout
+from wsn_metrics import StageTimer
+from wsn_reader import LOGGER_TIME_FORMAT
+
+# 縦持ちデータのカラム
+LONG_COLUMNS = ["TIME", "ノードID", "測定種別", "測定値"]
+# 電波強度の測定種別名
+RSSI_COLUMN = "電波強度[dB]"
+# 1ノードあたりの測定種別スロット数(電波強度 + 値1~値19)
+MEASURE_SLOTS = 1 + VALUE_SLOTS
+# 測定値の型。スケール変換はfloat64で行い、縦持ちデータを作る際にこの型へ変換する
+VALUE_DTYPES = ("float32", "float64")
+DEFAULT_VALUE_DTYPE = "float32"
+# 出力するデータの形: long=縦持ち(TIME, ノードID, 測定種別, 測定値),
+# wide=センサ種別ごとの横持ち(TIME, ノードID, 電波強度[dB], 測定種別名...)
+OUTPUT_SHAPES = ("long", "wide")
+# センサ種別が未定義のノードの横持ちデータのキー(電波強度のみ)
+UNKNOWN_SENS_CODE = -1
+
+
+class ScaledFile(NamedTuple):
+    """
+    1ファイル分のスケール変換結果。
+    long: 縦持ちデータ(欠損行は除外済み)。TIMEはdatetime64、ノードIDはint16(範囲外はint32)、
+          測定種別はcategory、測定値はvalue_dtypeとする。行は(TIME, ノード, 測定種別, 元の行)の順に並ぶ
+    latest_rows: データのあるノードごとの、ノードIDのある最後の行(TIME, ノードID, 電波強度[dB], 測定種別...)。
+                 測定種別名はその行のセンサ種別で決める
+    unknown_scale_codes: 測定値のある値のうち、スケールコードが未定義でNaNとした件数
+    wide: センサ種別コードごとの横持ちデータ。ノードIDのある行を(TIME, 元の行, ノード)の順に並べ、
+          欠損値はNaNのまま残す。センサ種別が未定義の行はUNKNOWN_SENS_CODEに電波強度だけを持つ
+    測定種別名は行ごとのセンサ種別で決めるため、途中でセンサが交換されたノードは交換前後で別の測定種別になる
+    longはshapesに"long"、wideは"wide"を指定した場合のみ作成する(指定しない場合はNone)
+    populated_nodes: ノードIDの値がある行が1行でもあったノード(layout.node_idsのうち)
+    invalid_time_rows: ノードIDのある行のうち、TIMEが空または書式が異なるため出力しなかった行数
+    long_time_text, wide_time_text: long・wideの各行のTIMEの、ロガーCSVに書かれていたままの文字列(CSVの出力に使う)
+    """
+    long: Optional[pd.DataFrame]
+    latest_rows: List[Dict[str, Any]]
+    unknown_scale_codes: int = 0
+    wide: Optional[Dict[int, pd.DataFrame]] = None
+    populated_nodes: Tuple[int, ...] = ()
+    invalid_time_rows: int = 0
+    long_time_text: Optional[np.ndarray] = None
+    wide_time_text: Optional[Dict[int, np.ndarray]] = None
+
+
+def node_id_dtype(layout: NodeLayout) -> type:
+    """
+    ノードIDの型。ノードIDがint16に収まる範囲ならint16とする。
+    """
+    return np.int16 if layout.end_node <= np.iinfo(np.int16).max else np.int32
+
+
+def empty_long_frame(value_dtype: str = DEFAULT_VALUE_DTYPE) -> pd.DataFrame:
+    return pd.DataFrame({
+        "TIME": pd.Series([], dtype="datetime64[ns]"),
+        "ノードID": pd.Series([], dtype=np.int16),
+        "測定種別": pd.Categorical([]),
+        "測定値": pd.Series([], dtype=value_dtype),
+    })
+
+
+def scale_wide_frame(df: pd.DataFrame, layout: NodeLayout, scale_table: ScaleTable,
+                     sens_table: SensTypeTable, timer: Optional[StageTimer] = None,
+                     value_dtype: str = DEFAULT_VALUE_DTYPE, shapes: Sequence[str] = ("long",)) -> ScaledFile:
+    """
+    ロガーCSV(横持ち)全体を一括でスケール変換し、縦持ちデータ(とセンサ種別ごとの横持ちデータ)に変換する。
+    ノード×19組の値/スケールを(行, ノード, スロット)の配列にまとめて処理するため、
+    ノードごとのDataFrame操作を行わない。出力はTIME順に並べた状態で返すため、呼び出し側での並べ替えは不要。
+    Args:
+        df (pd.DataFrame): ロガーCSVを読み込んだデータ(カラム順はgenerate_node_listと同じ)
+        layout (NodeLayout): get_node_layoutで取得したカラム配置
+        scale_table (ScaleTable): スケールコードの定義
+        sens_table (SensTypeTable): センサ種別の定義
+        timer (StageTimer): reshape, scale, melt, wide, sort(TIMEが昇順でない場合のみ)の各段階の処理時間を積算する
+        value_dtype (str): 測定値の型(VALUE_DTYPESのいずれか)
+        shapes (Sequence[str]): 作成するデータの形(OUTPUT_SHAPESのうち1つ以上)
+    Returns:
+        ScaledFile: 縦持ちデータ・横持ちデータと各ノードの最終行
+    """
+    n_nodes = layout.n_nodes
+    n_rows = len(df)
+    if df.shape[1] < layout.n_columns:
+        raise ValueError(
+            f"Length mismatch: node{layout.start_node}-{layout.end_node} requires {layout.n_columns} columns, got {df.shape[1]}"
+        )
+    timer = timer or StageTimer()
+    with timer.stage("reshape"):
+        n_header = len(NODE_HEADER_FIELDS)
+        # (行, ノード, [ノードID, 電波強度, センサ種別, 値1~19, スケール1~19])
+        block = df.iloc[:, layout.numeric_pos.ravel()].to_numpy(dtype=np.float64).reshape(
+            n_rows, n_nodes, layout.numeric_pos.shape[1]
+        )
+        node_ids = block[:, :, 0]
+        populated = ~np.isnan(node_ids).all(axis=0)
+        if not populated.any():
+            return ScaledFile(empty_long_frame(value_dtype) if "long" in shapes else None, [], 0,
+                              {} if "wide" in shapes else None)
+        times = df.iloc[:, 0].to_numpy()
+        # TIMEが空・書式の異なる行はNaTとして出力から除き、ファイル全体はエラーにしない
+        time_values = pd.to_datetime(df.iloc[:, 0], format=LOGGER_TIME_FORMAT, errors='coerce').to_numpy()
+        valid_time = ~np.isnat(time_values)
+        invalid_time_rows = int((~valid_time & ~np.isnan(node_ids).all(axis=1)).sum())
+        valid_times = time_values[valid_time]
+        # ロガーCSVは通常TIMEが昇順のため、行の順に取り出せばTIME順になる
+        time_ordered = bool((valid_times[1:] > valid_times[:-1]).all())
+
+    with timer.stage("scale"):
+        values = block[:, :, n_header:n_header + VALUE_SLOTS]
+        scale_codes = block[:, :, n_header + VALUE_SLOTS:]
+        # 全ノードの全スケール列を一度に倍率へ変換する
+        factors, unknown_scale = scale_table.decode(scale_codes)
+        scaled = values * factors
+        # スロット0に電波強度、スロット1以降にスケール済みの値を並べる
+        measures = np.concatenate([block[:, :, 1:2], scaled], axis=2)
+
+        # センサ種別は(行, ノード)ごとに判定する。未定義のコードは-1(電波強度のみ)
+        present = ~np.isnan(node_ids)
+        code_index = _row_code_index(block[:, :, 2], present, sens_table)
+        categories, name_table = _name_table(code_index, present, sens_table)
+        # 最終行にデータのないノードは、ノードIDのある最後の行を最新値とする
+        latest_row_idx = n_rows - 1 - np.argmax(present[::-1], axis=0)
+        latest_code_index = sens_table.code_index(block[latest_row_idx, np.arange(n_nodes), 2])
+        latest_rows = []
+        for node in np.flatnonzero(populated):
+            row = latest_row_idx[node]
+            names = unique_measure_names(_sens_names(sens_table, latest_code_index[node]))
+            latest_row = {
+                "TIME": times[row],
+                "ノードID": df.iat[row, layout.id_pos[node]],
+                RSSI_COLUMN: df.iat[row, layout.rssi_pos[node]],
+            }
+            latest_row.update(zip(names, scaled[row, node, :len(names)].tolist()))
+            latest_rows.append(latest_row)
+
+        # (行, ノード, スロット)ごとの、その行のセンサ種別で使うスロットか
+        slot_mask = name_table[code_index + 1] >= 0
+        unknown_scale_codes = int((unknown_scale & ~np.isnan(values) & slot_mask[:, :, 1:]).sum())
+
+    df_long = long_time_text = None
+    if "long" in shapes:
+        df_long, long_rows = _melt_measures(measures, node_ids, time_values, valid_time, time_ordered, slot_mask,
+                                            code_index, name_table, categories, node_id_dtype(layout),
+                                            value_dtype, timer)
+        long_time_text = times[long_rows]
+    wide = wide_time_text = None
+    if "wide" in shapes:
+        with timer.stage("wide"):
+            wide, wide_rows = _wide_frames(measures, node_ids, time_values, valid_time, time_ordered,
+                                           code_index, sens_table, node_id_dtype(layout), value_dtype)
+            wide_time_text = {code: times[rows] for code, rows in wide_rows.items()}
+    return ScaledFile(df_long, latest_rows, unknown_scale_codes, wide, tuple(layout.node_ids[populated].tolist()),
+                      invalid_time_rows, long_time_text, wide_time_text)
+
+
+def _sens_names(sens_table: SensTypeTable, code_index: int) -> List[str]:
+    """
+    センサ種別(code_indexの添字)の測定種別名。1ノードのスロット数を超える分と、未定義のコードは除く。
+    """
+    return list(sens_table.names[code_index][:VALUE_SLOTS]) if code_index >= 0 else []
+
+
+def unique_measure_names(names: Sequence[str]) -> List[str]:
+    """
+    横持ちデータ・最新値のカラム名にするため、重複する測定種別名を一意にする。
+    2回目以降に現れた名前には値の番号を付ける(例: sens_code 29の6番目は「検出エッジ2[-](値6)」)。
+    """
+    unique_names = []
+    for slot, name in enumerate(names, start=1):
+        unique_names.append(f"{name}(値{slot})" if name in unique_names else name)
+    return unique_names
+
+
+def _row_code_index(sens_codes: np.ndarray, present: np.ndarray, sens_table: SensTypeTable) -> np.ndarray:
+    """
+    (行, ノード)ごとのセンサ種別(sens_table.code_indexの添字)を返す。
+    どのノードもデータのある行のセンサ種別が1種類の場合(センサ交換がない場合)は、
+    (1, ノード)の配列を返す((行, ノード)の配列に対してブロードキャストして使う)。
+    """
+    first = present.argmax(axis=0)
+    node_codes = sens_codes[first, np.arange(sens_codes.shape[1])]
+    same = (sens_codes == node_codes) | (np.isnan(sens_codes) & np.isnan(node_codes)) | ~present
+    if same.all():
+        return sens_table.code_index(node_codes)[None, :]
+    return sens_table.code_index(sens_codes)
+
+
+def _name_table(code_index: np.ndarray, present: np.ndarray,
+                sens_table: SensTypeTable) -> Tuple[List[str], np.ndarray]:
+    """
+    (行, ノード)ごとのセンサ種別から、測定種別のカテゴリと、(センサ種別+1, スロット)ごとのカテゴリ番号の表を作成する。
+    カテゴリはノード順・行順に、センサ種別が最初に現れた順で測定種別名を並べる(電波強度が先頭)。
+    表の行0は未定義のセンサ種別(電波強度のみ)とし、使わないスロットは-1とする。
+    """
+    node_major = np.broadcast_to(code_index, present.shape).T[present.T]
+    codes, first = np.unique(node_major, return_index=True)
+    categories: Dict[str, int] = {RSSI_COLUMN: 0}
+    name_table = np.full((len(sens_table.names) + 1, MEASURE_SLOTS), -1, dtype=np.int32)
+    name_table[:, 0] = 0
+    for code in codes[np.argsort(first)]:
+        names = _sens_names(sens_table, code)
+        name_table[code + 1, 1:1 + len(names)] = [categories.setdefault(name, len(categories)) for name in names]
+    return list(categories), name_table
+
+
+def _melt_measures(measures: np.ndarray, node_ids: np.ndarray, time_values: np.ndarray,
+                   valid_time: np.ndarray, time_ordered: bool, slot_mask: np.ndarray,
+                   code_index: np.ndarray, name_table: np.ndarray, categories: List[str], id_dtype: type,
+                   value_dtype: str, timer: StageTimer) -> Tuple[pd.DataFrame, np.ndarray]:
+    """
+    (行, ノード, スロット)の測定値から縦持ちデータを作成する。
+    測定種別は(行, ノード)のセンサ種別からname_tableで引く。縦持ちデータの各行の元の行番号も返す。
+    """
+    with timer.stage("melt"):
+        # TIMEが昇順なら(行, ノード, 測定種別)の順に取り出せばTIME順になる
+        # (ノードごとにmeltしてTIMEで安定ソートした結果と同じ順序)
+        keep = slot_mask & ~np.isnan(measures) & ~np.isnan(node_ids)[:, :, None]
+        keep &= valid_time[:, None, None]
+        row_idx, node_idx, slot_idx = np.nonzero(keep)
+        measure_values = measures[keep]
+    if not time_ordered:
+        # 時刻の重複・逆行がある場合だけ、(ノード, 測定種別, 行)の順に取り出し直してTIMEで安定ソートする
+        with timer.stage("sort"):
+            keep = keep.transpose(1, 2, 0)
+            node_idx, slot_idx, row_idx = np.nonzero(keep)
+            measure_values = measures.transpose(1, 2, 0)[keep]
+            order = np.argsort(time_values[row_idx], kind='stable')
+            row_idx, node_idx, slot_idx = row_idx[order], node_idx[order], slot_idx[order]
+            measure_values = measure_values[order]
+    with timer.stage("melt"):
+        if code_index.shape[0] == 1:
+            # センサ交換がない場合は(ノード, スロット)ごとのカテゴリ番号から引く
+            name_codes = name_table[code_index[0] + 1][node_idx, slot_idx]
+        else:
+            name_codes = name_table[code_index[row_idx, node_idx] + 1, slot_idx]
+        return pd.DataFrame({
+            "TIME": time_values[row_idx],
+            "ノードID": node_ids[row_idx, node_idx].astype(id_dtype),
+            "測定種別": pd.Categorical.from_codes(name_codes, categories=categories),
+            "測定値": measure_values.astype(value_dtype, copy=False),
+        }), row_idx
+
+
+def _wide_frames(measures: np.ndarray, node_ids: np.ndarray, time_values: np.ndarray,
+                 valid_time: np.ndarray, time_ordered: bool, code_index: np.ndarray,
+                 sens_table: SensTypeTable, id_dtype: type,
+                 value_dtype: str) -> Tuple[Dict[int, pd.DataFrame], Dict[int, np.ndarray]]:
+    """
+    (行, ノード, スロット)の測定値から、センサ種別コードごとの横持ちデータを作成する。
+    meltを行わず、その行のセンサ種別が同じ(行, ノード)を1行とする。横持ちデータの各行の元の行番号も返す。
+    """
+    frames = {}
+    source_rows = {}
+    present = ~np.isnan(node_ids) & valid_time[:, None]
+    for code in np.unique(np.broadcast_to(code_index, present.shape)[present]):
+        names = unique_measure_names(_sens_names(sens_table, code))
+        row_idx, node_idx = np.nonzero(present & (code_index == code))
+        if not time_ordered:
+            order = np.argsort(time_values[row_idx], kind='stable')
+            row_idx, node_idx = row_idx[order], node_idx[order]
+        values = measures[row_idx, node_idx, :1 + len(names)].astype(value_dtype, copy=False)
+        frame = pd.DataFrame(values, columns=[RSSI_COLUMN] + names)
+        frame.insert(0, "TIME", time_values[row_idx])
+        frame.insert(1, "ノードID", node_ids[row_idx, node_idx].astype(id_dtype))
+        key = UNKNOWN_SENS_CODE if code < 0 else int(code)
+        frames[key] = frame
+        source_rows[key] = row_idx
+    return frames, source_rows
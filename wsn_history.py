@@ -0,0 +1,282 @@
+import os
+import json
+import hashlib
+import sqlite3
+import argparse
+from datetime import datetime
+from typing import Dict, Iterable, NamedTuple, Optional, Set, Tuple
+
+from convert_p_drive_to_network import convert_path
+
+
+# 内容ハッシュを計算する際の読み込み単位
+HASH_BLOCK_SIZE = 1024 * 1024
+
+
+class FileIdentity(NamedTuple):
+    """
+    パスに依存しないファイルの識別子。ノード範囲と日付が同じでサイズと内容ハッシュが
+    一致すれば、別の場所に移動・再同期されたファイルでも同じ内容とみなす。
+    """
+    node_range: str
+    yyyymmdd: str
+    size: int
+    content_hash: str
+
+
+def log_file_key(file_path: str) -> Tuple[str, str]:
+    """
+    ロガーCSVのファイル名(node{a}-{b}_{yyyymmdd}.CSV)からノード範囲と日付を取り出す。
+    """
+    stem = os.path.splitext(os.path.basename(file_path))[0]
+    node_range, _, yyyymmdd = stem.rpartition('_')
+    return node_range, yyyymmdd
+
+
+def content_identity(file_path: str, data: bytes) -> FileIdentity:
+    """
+    読み込み済みのファイル内容から識別子を作る。
+    """
+    return FileIdentity(*log_file_key(file_path), len(data), hashlib.blake2b(data, digest_size=16).hexdigest())
+
+
+def file_identity(file_path: str) -> FileIdentity:
+    """
+    ファイルを読み込んで識別子を作る。
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    size = 0
+    with open(file_path, 'rb') as f:
+        while block := f.read(HASH_BLOCK_SIZE):
+            digest.update(block)
+            size += len(block)
+    return FileIdentity(*log_file_key(file_path), size, digest.hexdigest())
+
+
+class IncrementalState(NamedTuple):
+    """
+    当日分のロガーCSVをどこまで処理したか。
+    byte_offset: 処理済みの最終行の終端位置
+    last_line_offset: 処理済みの最終データ行の先頭位置(データ行がない場合はNone)
+    last_time: 処理済みの最終行のTIME
+    part_count: 出力済みのParquetの分割数(データセット出力の場合)
+    """
+    file_path: str
+    byte_offset: int
+    last_line_offset: Optional[int]
+    last_time: Optional[str]
+    part_count: int
+
+
+class ProcessedFileHistory:
+    """
+    処理済みファイルの履歴をSQLiteで管理する。
+    履歴は生成時に一度だけ読み込み、判定はメモリ上のsetで行う。
+    パスとは別に、ノード範囲・日付ごとに処理した内容の識別子(FileIdentity)を持つ。
+    """
+
+    def __init__(self, db_path: str) -> None:
+        db_dir = os.path.dirname(db_path)
+        if db_dir and not os.path.exists(db_dir):
+            os.makedirs(db_dir)
+        self.db_path = db_path
+        self._conn = sqlite3.connect(db_path)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS preprocessed_file ("
+            " file_path TEXT PRIMARY KEY,"
+            " file_name TEXT NOT NULL,"
+            " processed_at TEXT NOT NULL)"
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS incremental_file ("
+            " file_path TEXT PRIMARY KEY,"
+            " byte_offset INTEGER NOT NULL,"
+            " last_line_offset INTEGER,"
+            " last_time TEXT,"
+            " part_count INTEGER NOT NULL,"
+            " updated_at TEXT NOT NULL)"
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS processed_content ("
+            " node_range TEXT NOT NULL,"
+            " yyyymmdd TEXT NOT NULL,"
+            " size INTEGER NOT NULL,"
+            " content_hash TEXT NOT NULL,"
+            " file_path TEXT NOT NULL,"
+            " processed_at TEXT NOT NULL,"
+            " PRIMARY KEY (node_range, yyyymmdd))"
+        )
+        self._conn.commit()
+        self._processed: Set[str] = {
+            row[0] for row in self._conn.execute("SELECT file_path FROM preprocessed_file")
+        }
+        self._incremental: Dict[str, IncrementalState] = {
+            row[0]: IncrementalState(*row) for row in self._conn.execute(
+                "SELECT file_path, byte_offset, last_line_offset, last_time, part_count FROM incremental_file"
+            )
+        }
+        self._identities: Dict[Tuple[str, str], FileIdentity] = {
+            (row[0], row[1]): FileIdentity(*row) for row in self._conn.execute(
+                "SELECT node_range, yyyymmdd, size, content_hash FROM processed_content"
+            )
+        }
+
+    def __contains__(self, file_path: str) -> bool:
+        return file_path in self._processed
+
+    def __len__(self) -> int:
+        return len(self._processed)
+
+    def add(self, file_path: str, identity: Optional[FileIdentity] = None) -> None:
+        """
+        処理済みファイルを履歴に追加する。identityを指定した場合は処理した内容の識別子も記録する。
+        """
+        processed_at = datetime.now().isoformat(timespec='seconds')
+        with self._conn:
+            if file_path not in self._processed:
+                self._conn.execute(
+                    "INSERT OR IGNORE INTO preprocessed_file (file_path, file_name, processed_at) VALUES (?, ?, ?)",
+                    (file_path, os.path.basename(file_path), processed_at)
+                )
+            if identity is not None:
+                self._save_identity(file_path, identity, processed_at)
+        self._processed.add(file_path)
+
+    def _save_identity(self, file_path: str, identity: FileIdentity, processed_at: str) -> None:
+        self._conn.execute(
+            "INSERT OR REPLACE INTO processed_content"
+            " (node_range, yyyymmdd, size, content_hash, file_path, processed_at) VALUES (?, ?, ?, ?, ?, ?)",
+            (*identity, file_path, processed_at)
+        )
+        self._identities[(identity.node_range, identity.yyyymmdd)] = identity
+
+    def is_processed_content(self, file_path: str, size: int, read_path: Optional[str] = None) -> bool:
+        """
+        ファイルの内容が処理済みの内容と同じか判定する。
+        ノード範囲・日付・サイズが一致する場合だけ内容ハッシュを計算して照合する。
+        read_pathを指定した場合はそのファイル(ソースキャッシュのローカルのコピー)の内容ハッシュを計算する。
+        """
+        recorded = self._identities.get(log_file_key(file_path))
+        if recorded is None or recorded.size != size:
+            return False
+        return file_identity(read_path or file_path) == recorded
+
+    def backfill_identities(self) -> int:
+        """
+        内容の識別子が記録されていない処理済みファイルについて、現在の内容から識別子を記録する。
+        Returns:
+            int: 記録した件数
+        """
+        count = 0
+        processed_at = datetime.now().isoformat(timespec='seconds')
+        with self._conn:
+            for file_path in sorted(self._processed):
+                if log_file_key(file_path) in self._identities or not os.path.isfile(file_path):
+                    continue
+                self._save_identity(file_path, file_identity(file_path), processed_at)
+                count += 1
+        return count
+
+    def add_many(self, file_paths: Iterable[str]) -> int:
+        """
+        複数の処理済みファイルを一つのトランザクションで履歴に追加する。
+        Returns:
+            int: 新たに追加した件数
+        """
+        processed_at = datetime.now().isoformat(timespec='seconds')
+        new_paths = [p for p in dict.fromkeys(file_paths) if p not in self._processed]
+        with self._conn:
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO preprocessed_file (file_path, file_name, processed_at) VALUES (?, ?, ?)",
+                [(p, os.path.basename(p), processed_at) for p in new_paths]
+            )
+        self._processed.update(new_paths)
+        return len(new_paths)
+
+    def incremental_state(self, file_path: str) -> Optional[IncrementalState]:
+        """
+        当日分として途中まで処理したファイルの処理位置を返す。
+        """
+        return self._incremental.get(file_path)
+
+    def save_incremental_state(self, state: IncrementalState) -> None:
+        self._conn.execute(
+            "INSERT OR REPLACE INTO incremental_file"
+            " (file_path, byte_offset, last_line_offset, last_time, part_count, updated_at)"
+            " VALUES (?, ?, ?, ?, ?, ?)",
+            (*state, datetime.now().isoformat(timespec='seconds'))
+        )
+        self._conn.commit()
+        self._incremental[state.file_path] = state
+
+    def clear_incremental_state(self, file_path: str) -> None:
+        if self._incremental.pop(file_path, None) is None:
+            return
+        self._conn.execute("DELETE FROM incremental_file WHERE file_path = ?", (file_path,))
+        self._conn.commit()
+
+    def import_json(self, json_path: str, convert_p_drive: bool = False) -> int:
+        """
+        旧形式の履歴JSON(preprocessed_file_history.json)を取り込む。
+        convert_p_drive_to_network.py で変換済みのJSONもそのまま取り込める。
+        Args:
+            json_path (str): 履歴JSONのパス
+            convert_p_drive (bool): P:ドライブのパスをネットワークパスに変換して取り込むか
+        Returns:
+            int: 新たに追加した件数
+        """
+        with open(json_path, 'r', encoding='utf-8') as json_file:
+            data = json.load(json_file)
+        file_paths = [
+            entry["file_path"] for entry in data.get("preprocessed_file_path", [])
+            if "file_path" in entry
+        ]
+        if convert_p_drive:
+            file_paths = [convert_path(p) for p in file_paths]
+        return self.add_many(file_paths)
+
+    def close(self) -> None:
+        self._conn.close()
+
+    def __enter__(self) -> "ProcessedFileHistory":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+
+def open_file_history(db_path: str, legacy_json_path: str = None) -> ProcessedFileHistory:
+    """
+    履歴DBを開く。DBが空で旧形式のJSONが存在する場合は取り込む。
+    """
+    history = ProcessedFileHistory(db_path)
+    if len(history) == 0 and legacy_json_path and os.path.exists(legacy_json_path):
+        try:
+            count = history.import_json(legacy_json_path)
+            print(f"旧履歴JSONから {count} 件を取り込みました: {legacy_json_path}")
+        except (json.JSONDecodeError, IOError) as e:
+            print(f"Error reading JSON file: {e}")
+    return history
+
+
+def main():
+    parser = argparse.ArgumentParser(description="旧形式の処理済みファイル履歴JSONを履歴DBに取り込む")
+    parser.add_argument("db_path", help="履歴DB(SQLite)のパス")
+    parser.add_argument("json_paths", nargs="*", help="取り込む履歴JSONのパス")
+    parser.add_argument("--convert-p-drive", action="store_true",
+                        help="P:ドライブのパスをネットワークパスに変換して取り込む")
+    parser.add_argument("--backfill-identities", action="store_true",
+                        help="処理済みファイルの内容の識別子(サイズ・内容ハッシュ)を現在のファイルから記録する")
+    args = parser.parse_args()
+    with ProcessedFileHistory(args.db_path) as history:
+        for json_path in args.json_paths:
+            count = history.import_json(json_path, convert_p_drive=args.convert_p_drive)
+            print(f"取り込み完了: {json_path} ({count} 件追加, 合計 {len(history)} 件)")
+        if args.backfill_identities:
+            count = history.backfill_identities()
+            print(f"内容の識別子を {count} 件記録しました。")
+
+
+if __name__ == '__main__':
+    main()
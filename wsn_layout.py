@@ -0,0 +1,244 @@
+import re
+from functools import lru_cache
+from typing import Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+import numpy as np
+
+# ノードごとの共通カラム(ノードID, 電波強度, センサ種別)
+NODE_HEADER_FIELDS = ("ノードID", "電波強度", "センサ種別")
+# 1ノードあたりの値/スケール/単位の組数
+VALUE_SLOTS = 19
+# 1ノードあたりのカラム数
+NODE_BLOCK_WIDTH = len(NODE_HEADER_FIELDS) + VALUE_SLOTS * 3
+
+
+def generate_node_list(start_node_id: int, end_node_id: int) -> List[str]:
+    """
+    指定したノードID範囲のカラム名リストを生成する。
+    Args:
+        start_node_id (int): 開始ノードID
+        end_node_id (int): 終了ノードID
+    Returns:
+        List[str]: カラム名リスト
+    """
+    if not (1 <= start_node_id <= 9999 and 1 <= end_node_id <= 9999):
+        raise ValueError("Node IDs must be between 1 and 9999")
+    if start_node_id > end_node_id:
+        raise ValueError("Start node ID must be less than or equal to end node ID")
+    result = ["TIME"]
+    for node_id in range(start_node_id, end_node_id + 1):
+        node_prefix = f"ノード{node_id:04d}"
+        result.extend([
+            f"{node_prefix}:ノードID",
+            f"{node_prefix}:電波強度",
+            f"{node_prefix}:センサ種別"
+        ])
+        for i in range(1, VALUE_SLOTS + 1):
+            result.extend([
+                f"{node_prefix}:値{i}",
+                f"{node_prefix}:スケール{i}",
+                f"{node_prefix}:単位{i}"
+            ])
+    return result
+
+
+class NodeLayout(NamedTuple):
+    """
+    ノードID範囲ごとのカラム配置。位置はすべてDataFrame上の列番号。
+    node_ids, id_pos, rssi_pos, sens_type_pos: (ノード数,)。ノード数はget_numeric_layoutで
+    ノードを絞り込んだ場合、範囲内のノードの一部となる
+    value_pos, scale_pos, unit_pos: (ノード数, VALUE_SLOTS)
+    numeric_pos: ノードごとに[ノードID, 電波強度, センサ種別, 値1~19, スケール1~19]の順で並べた列番号
+    source_pos: columnsの各カラムのロガーCSV上の列番号(get_numeric_layoutの場合のみ連番でない)
+    layout_from_headerでカラム名から求めた場合、start_node, end_nodeはnode_idsの最小値, 最大値とする
+    """
+    start_node: int
+    end_node: int
+    columns: Tuple[str, ...]
+    node_ids: np.ndarray
+    id_pos: np.ndarray
+    rssi_pos: np.ndarray
+    sens_type_pos: np.ndarray
+    value_pos: np.ndarray
+    scale_pos: np.ndarray
+    unit_pos: np.ndarray
+    numeric_pos: np.ndarray
+    source_pos: np.ndarray
+
+    @property
+    def n_nodes(self) -> int:
+        return len(self.node_ids)
+
+    @property
+    def n_columns(self) -> int:
+        return len(self.columns)
+
+
+@lru_cache(maxsize=None)
+def get_node_layout(start_node_id: int, end_node_id: int) -> NodeLayout:
+    """
+    ノードID範囲のカラム配置を返す。同じ範囲の2回目以降はキャッシュを返す。
+    """
+    columns = tuple(generate_node_list(start_node_id, end_node_id))
+    node_ids = np.arange(start_node_id, end_node_id + 1)
+    node_base = 1 + np.arange(len(node_ids)) * NODE_BLOCK_WIDTH
+    value_pos = node_base[:, None] + len(NODE_HEADER_FIELDS) + np.arange(VALUE_SLOTS) * 3
+    header_pos = node_base[:, None] + np.arange(len(NODE_HEADER_FIELDS))
+    layout = NodeLayout(
+        start_node=start_node_id,
+        end_node=end_node_id,
+        columns=columns,
+        node_ids=node_ids,
+        id_pos=node_base,
+        rssi_pos=node_base + 1,
+        sens_type_pos=node_base + 2,
+        value_pos=value_pos,
+        scale_pos=value_pos + 1,
+        unit_pos=value_pos + 2,
+        numeric_pos=np.concatenate([header_pos, value_pos, value_pos + 1], axis=1),
+        source_pos=np.arange(len(columns)),
+    )
+    for array in layout[3:]:
+        array.flags.writeable = False
+    return layout
+
+
+def layout_from_header(columns: Sequence[str], start_node_id: int, end_node_id: int) -> NodeLayout:
+    """
+    ロガーCSVのカラム名行からカラム配置を求める。
+    カラム名はgenerate_node_listと同じ"ノード{ID}:{項目}"の形式、または項目名のみとし、
+    "ノードID"のカラムを各ノードの先頭として、そのノードの各項目のカラムを名前で探す。
+    ノードIDはカラム名の数字から取り、カラム名に数字がない場合はフォルダ名のノードID範囲の順とする。
+    カラム名がgenerate_node_listと一致する場合(ノードIDのカラムがなくカラム数が一致する場合を含む)は
+    get_node_layoutと同じものを返す。ノードIDのカラムがなくカラム数が多い場合(末尾に余分なカラムがある、
+    カラム名の形式が異なる場合)は、警告してget_node_layoutの配置(先頭のカラム)を使う。
+    Args:
+        columns (Sequence[str]): カラム名行のカラム名
+        start_node_id (int): フォルダ名の開始ノードID
+        end_node_id (int): フォルダ名の終了ノードID
+    Returns:
+        NodeLayout: カラム配置
+    """
+    columns = tuple(name.strip() for name in columns)
+    expected = get_node_layout(start_node_id, end_node_id)
+    if columns == expected.columns:
+        return expected
+    fields = [name.rsplit(':', 1)[-1].strip() for name in columns]
+    starts = [pos for pos, field in enumerate(fields) if field == NODE_HEADER_FIELDS[0]]
+    if not starts:
+        if len(columns) == expected.n_columns:
+            return expected
+        if len(columns) > expected.n_columns:
+            print(f"警告: カラム名行に{NODE_HEADER_FIELDS[0]}のカラムがないため、node{start_node_id}-{end_node_id}の"
+                  f"カラム配置で先頭の{expected.n_columns}列を読み込みます(カラム数 {len(columns)})")
+            return expected
+        raise ValueError(
+            f"Length mismatch: node{start_node_id}-{end_node_id} requires {expected.n_columns} columns, "
+            f"got {len(columns)} columns without a {NODE_HEADER_FIELDS[0]} column"
+        )
+
+    labels = []
+    positions = []
+    for block_start, block_end in zip(starts, starts[1:] + [len(columns)]):
+        block: Dict[str, int] = {}
+        for pos in range(block_start, block_end):
+            block.setdefault(fields[pos], pos)
+        fields_pos = []
+        for field in (NODE_HEADER_FIELDS
+                      + tuple(f"値{i}" for i in range(1, VALUE_SLOTS + 1))
+                      + tuple(f"スケール{i}" for i in range(1, VALUE_SLOTS + 1))
+                      + tuple(f"単位{i}" for i in range(1, VALUE_SLOTS + 1))):
+            if field not in block:
+                raise ValueError(f"Missing column {field!r} in the node block starting at column {block_start}")
+            fields_pos.append(block[field])
+        positions.append(fields_pos)
+        labels.append(_header_node_id(columns[block_start]))
+
+    if all(label is not None for label in labels):
+        node_ids = np.array(labels)
+    elif any(label is not None for label in labels):
+        raise ValueError("Node IDs are given for only some node blocks in the header")
+    elif len(starts) == end_node_id - start_node_id + 1:
+        node_ids = np.arange(start_node_id, end_node_id + 1)
+    else:
+        raise ValueError(
+            f"node{start_node_id}-{end_node_id} has {end_node_id - start_node_id + 1} nodes, "
+            f"but the header has {len(starts)} node blocks without node IDs"
+        )
+    if len(np.unique(node_ids)) != len(node_ids):
+        raise ValueError("Duplicate node IDs in the header")
+
+    positions = np.array(positions)
+    n_header = len(NODE_HEADER_FIELDS)
+    value_pos = positions[:, n_header:n_header + VALUE_SLOTS]
+    scale_pos = positions[:, n_header + VALUE_SLOTS:n_header + VALUE_SLOTS * 2]
+    layout = NodeLayout(
+        start_node=int(node_ids.min()),
+        end_node=int(node_ids.max()),
+        columns=columns,
+        node_ids=node_ids,
+        id_pos=positions[:, 0],
+        rssi_pos=positions[:, 1],
+        sens_type_pos=positions[:, 2],
+        value_pos=value_pos,
+        scale_pos=scale_pos,
+        unit_pos=positions[:, n_header + VALUE_SLOTS * 2:],
+        numeric_pos=np.concatenate([positions[:, :n_header], value_pos, scale_pos], axis=1),
+        source_pos=np.arange(len(columns)),
+    )
+    for array in layout[3:]:
+        array.flags.writeable = False
+    return layout
+
+
+def _header_node_id(column: str) -> Optional[int]:
+    """
+    "ノード{ID}:ノードID"の形式のカラム名からノードIDを取り出す。取り出せない場合はNone。
+    """
+    if ':' not in column:
+        return None
+    match = re.search(r'\d+', column.rsplit(':', 1)[0])
+    return int(match.group()) if match else None
+
+
+@lru_cache(maxsize=None)
+def get_numeric_layout(start_node_id: int, end_node_id: int, nodes: Optional[Tuple[int, ...]] = None) -> NodeLayout:
+    """
+    ロガーCSVからTIMEとスケール変換に使うカラム(ノードID, 電波強度, センサ種別, 値, スケール)だけを
+    読み込んだ場合のカラム配置を返す。単位カラムは読み込まないため、unit_posは-1とする。
+    nodesを指定した場合は、そのノードID(範囲内のもの)のカラムだけを読み込む。
+    """
+    return numeric_layout(get_node_layout(start_node_id, end_node_id), nodes)
+
+
+def numeric_layout(full_layout: NodeLayout, nodes: Optional[Tuple[int, ...]] = None) -> NodeLayout:
+    """
+    ロガーCSVの全カラムの配置(get_node_layoutまたはlayout_from_header)から、
+    get_numeric_layoutと同じ方法でスケール変換に使うカラムだけの配置を求める。
+    """
+    if nodes is not None:
+        selected = np.isin(full_layout.node_ids, nodes)
+        full_layout = full_layout._replace(**{
+            field: getattr(full_layout, field)[selected]
+            for field in ("node_ids", "id_pos", "rssi_pos", "sens_type_pos", "value_pos", "scale_pos",
+                          "unit_pos", "numeric_pos")
+        })
+    source_pos = np.sort(np.concatenate([[0], full_layout.numeric_pos.ravel()]))
+
+    def remap(pos: np.ndarray) -> np.ndarray:
+        return np.searchsorted(source_pos, pos)
+
+    layout = full_layout._replace(
+        columns=tuple(full_layout.columns[pos] for pos in source_pos),
+        id_pos=remap(full_layout.id_pos),
+        rssi_pos=remap(full_layout.rssi_pos),
+        sens_type_pos=remap(full_layout.sens_type_pos),
+        value_pos=remap(full_layout.value_pos),
+        scale_pos=remap(full_layout.scale_pos),
+        unit_pos=np.full_like(full_layout.unit_pos, -1),
+        numeric_pos=remap(full_layout.numeric_pos),
+        source_pos=source_pos,
+    )
+    for array in layout[3:]:
+        array.flags.writeable = False
+    return layout
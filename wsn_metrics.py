@@ -0,0 +1,156 @@
+import os
+import json
+import time
+import heapq
+import marshal
+import cProfile
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Any, Dict, Iterator, List, NamedTuple, Optional, Tuple
+
+# ファイルごとに計測する段階。historyには処理済み判定用の内容ハッシュの計算も含む
+FILE_STAGES = ("prescan", "read", "reshape", "scale", "melt", "wide", "sort", "write_csv", "write_parquet", "history")
+# 集計の表示順
+STAGE_ORDER = ("discover", "fetch") + FILE_STAGES + ("excel",)
+
+
+class StageTimer:
+    """
+    段階ごとの処理時間[s]を積算する。同じ段階を複数回計測した場合は合計する。
+    """
+
+    def __init__(self) -> None:
+        self.seconds: Dict[str, float] = {}
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        s_time = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.seconds[name] = self.seconds.get(name, 0.0) + time.perf_counter() - s_time
+
+
+class FileMetrics(NamedTuple):
+    """
+    1ファイル分の計測結果。modeはfull, chunked, incrementalのいずれか。
+    rowsは読み込んだ行数、long_rowsは出力した行数(横持ちデータも出力した場合はその行数を含む)。
+    """
+    file_path: str
+    mode: str
+    rows: int
+    long_rows: int
+    stages: Dict[str, float]
+    total: float
+
+
+@contextmanager
+def profile_if(enabled: bool) -> Iterator[Optional[cProfile.Profile]]:
+    """
+    enabledの場合はcProfileで計測する。計測結果はprofile_stats()で取り出す。
+    """
+    if not enabled:
+        yield None
+        return
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield profiler
+    finally:
+        profiler.disable()
+
+
+def profile_stats(profiler: Optional[cProfile.Profile]) -> Optional[dict]:
+    """
+    プロセス間で受け渡せる形(pstatsの.profファイルと同じ辞書)で計測結果を返す。
+    """
+    if profiler is None:
+        return None
+    profiler.create_stats()
+    return profiler.stats
+
+
+class MetricsRecorder:
+    """
+    ファイルごとの計測結果をJSON Lines形式で書き出し、実行の最後に段階ごとの集計を表示する。
+    profile_topを指定した場合は、処理時間の長い順にその件数のcProfileの結果を
+    profile_dirに{ファイル名}.profとして保存する。
+    """
+
+    def __init__(self, jsonl_path: Optional[str] = None, profile_dir: Optional[str] = None,
+                 profile_top: int = 0) -> None:
+        self.jsonl_path = jsonl_path
+        self.profile_dir = profile_dir
+        self.profile_top = profile_top
+        self.started_at = datetime.now().isoformat(timespec='seconds')
+        self.run_timer = StageTimer()
+        self.stage_totals: Dict[str, float] = {}
+        self.files = 0
+        self.rows = 0
+        self.long_rows = 0
+        self._records: List[Dict[str, Any]] = []
+        self._slowest: List[Tuple[float, int, str, dict]] = []
+
+    def stage(self, name: str):
+        """
+        ファイル単位でない段階(スキャン、エクセル出力)を計測する。
+        """
+        return self.run_timer.stage(name)
+
+    def add_file(self, metrics: FileMetrics, stats: Optional[dict] = None) -> None:
+        self.files += 1
+        self.rows += metrics.rows
+        self.long_rows += metrics.long_rows
+        for name, seconds in metrics.stages.items():
+            self.stage_totals[name] = self.stage_totals.get(name, 0.0) + seconds
+        self._records.append({"type": "file", "run": self.started_at, **metrics._asdict()})
+        if stats is not None and self.profile_top > 0:
+            entry = (metrics.total, self.files, metrics.file_path, stats)
+            if len(self._slowest) < self.profile_top:
+                heapq.heappush(self._slowest, entry)
+            else:
+                heapq.heappushpop(self._slowest, entry)
+
+    def close(self) -> None:
+        """
+        計測結果を書き出し、集計を表示する。
+        """
+        stages = {**self.stage_totals, **self.run_timer.seconds}
+        run_record = {
+            "type": "run", "run": self.started_at, "files": self.files, "rows": self.rows,
+            "long_rows": self.long_rows, "stages": stages, "total": sum(stages.values()),
+        }
+        if self.jsonl_path:
+            jsonl_dir = os.path.dirname(self.jsonl_path)
+            if jsonl_dir:
+                os.makedirs(jsonl_dir, exist_ok=True)
+            with open(self.jsonl_path, 'a', encoding='utf-8') as f:
+                for record in self._records + [run_record]:
+                    f.write(json.dumps(record, ensure_ascii=False) + '\n')
+        self._records.clear()
+        self.print_summary(stages)
+        self._dump_profiles()
+
+    def print_summary(self, stages: Dict[str, float]) -> None:
+        total = sum(stages.values())
+        print(f"処理時間の内訳: {self.files} ファイル, {self.rows} 行 -> {self.long_rows} 行")
+        ordered = [name for name in STAGE_ORDER if name in stages]
+        ordered += [name for name in stages if name not in ordered]
+        for name in ordered:
+            seconds = stages[name]
+            share = seconds / total * 100 if total else 0.0
+            rate = f", {self.rows / seconds:,.0f} 行/s" if name in FILE_STAGES and seconds and self.rows else ""
+            print(f"  {name:>13}: {seconds:8.3f}s ({share:5.1f}%){rate}")
+
+    def _dump_profiles(self) -> None:
+        if not self._slowest:
+            return
+        profile_dir = self.profile_dir or '.'
+        os.makedirs(profile_dir, exist_ok=True)
+        print(f"処理時間の長いファイル {len(self._slowest)} 件のプロファイル:")
+        for total, _, file_path, stats in sorted(self._slowest, reverse=True):
+            profile_path = os.path.join(profile_dir, f"{os.path.basename(file_path)}.prof")
+            with open(profile_path, 'wb') as f:
+                marshal.dump(stats, f)
+            print(f"  {total:8.3f}s {profile_path}")
+        self._slowest.clear()
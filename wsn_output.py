@@ -0,0 +1,285 @@
+import os
+import glob
+from typing import List, NamedTuple, Optional, TextIO
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from wsn_engine import UNKNOWN_SENS_CODE, empty_long_frame
+from wsn_metrics import StageTimer
+from wsn_reader import LOGGER_TIME_FORMAT
+
+# 出力CSVの文字コード
+OUTPUT_CSV_ENCODING = 'shift-jis'
+# 出力方式: files=ファイルごとのCSV+Parquet, dataset=ノード範囲/日付で分割したParquetデータセット
+OUTPUT_MODES = ("files", "dataset")
+# Parquetデータセットの出力先フォルダ名(縦持ち、センサ種別ごとの横持ち)
+DATASET_DIR_NAME = 'dataset'
+WIDE_DATASET_DIR_NAME = 'wide_dataset'
+# Parquetの1行グループあたりの行数。TIME順に並んでいるため、行グループごとの
+# TIMEの最小/最大値で時間範囲の絞り込みが効く程度に細かく分ける
+DEFAULT_ROW_GROUP_SIZE = 65536
+
+
+class OutputTarget(NamedTuple):
+    """
+    1ファイル分の出力先。csv_pathがNoneの場合はCSVを出力しない。
+    """
+    csv_path: Optional[str]
+    parquet_path: str
+    dataset: bool = False
+    row_group_size: int = DEFAULT_ROW_GROUP_SIZE
+
+
+def output_target(output_folder_path: str, start_node: int, end_node: int, yyyymmdd: str,
+                  mode: str = "files", write_csv: bool = True,
+                  row_group_size: int = DEFAULT_ROW_GROUP_SIZE) -> OutputTarget:
+    """
+    ノード範囲と日付から出力先を決める。
+    files: {出力先}/node{a}-{b}/node{a}-{b}_{yyyymmdd}.csv/.parquet
+    dataset: {出力先}/dataset/node_range=node{a}-{b}/date={yyyymmdd}/part-0.parquet
+    """
+    if mode not in OUTPUT_MODES:
+        raise ValueError(f"Unknown output mode: {mode}")
+    node_range = f'node{start_node}-{end_node}'
+    file_path = os.path.join(output_folder_path, node_range, f'{node_range}_{yyyymmdd}')
+    csv_path = f'{file_path}.csv' if write_csv else None
+    if mode == "files":
+        return OutputTarget(csv_path, f'{file_path}.parquet', False, row_group_size)
+    parquet_path = os.path.join(
+        output_folder_path, DATASET_DIR_NAME, f'node_range={node_range}', f'date={yyyymmdd}', 'part-0.parquet'
+    )
+    return OutputTarget(csv_path, parquet_path, True, row_group_size)
+
+
+def sens_code_label(sens_code: int) -> str:
+    """
+    横持ちデータの出力先に使うセンサ種別コードの表記(例: sens9, 未定義はsens_unknown)。
+    """
+    return 'sens_unknown' if sens_code == UNKNOWN_SENS_CODE else f'sens{sens_code}'
+
+
+def wide_output_target(output_folder_path: str, start_node: int, end_node: int, yyyymmdd: str,
+                       sens_code: int, mode: str = "files", write_csv: bool = True,
+                       row_group_size: int = DEFAULT_ROW_GROUP_SIZE) -> OutputTarget:
+    """
+    センサ種別ごとの横持ちデータの出力先を決める。
+    files: {出力先}/node{a}-{b}/node{a}-{b}_{yyyymmdd}_sens{code}.csv/.parquet
+    dataset: {出力先}/wide_dataset/sens_code=sens{code}/node_range=node{a}-{b}/date={yyyymmdd}/part-0.parquet
+    """
+    if mode not in OUTPUT_MODES:
+        raise ValueError(f"Unknown output mode: {mode}")
+    node_range = f'node{start_node}-{end_node}'
+    label = sens_code_label(sens_code)
+    file_path = os.path.join(output_folder_path, node_range, f'{node_range}_{yyyymmdd}_{label}')
+    csv_path = f'{file_path}.csv' if write_csv else None
+    if mode == "files":
+        return OutputTarget(csv_path, f'{file_path}.parquet', False, row_group_size)
+    parquet_path = os.path.join(
+        output_folder_path, WIDE_DATASET_DIR_NAME, f'sens_code={label}', f'node_range={node_range}',
+        f'date={yyyymmdd}', 'part-0.parquet'
+    )
+    return OutputTarget(csv_path, parquet_path, True, row_group_size)
+
+
+def to_arrow_table(df: pd.DataFrame, schema: Optional[pa.Schema] = None) -> pa.Table:
+    """
+    縦持ち・横持ちデータをArrowテーブルに変換する。測定種別(category)は辞書エンコードとし、
+    チャンクごとにカテゴリ数が変わっても同じスキーマで書けるよう辞書の番号はint32とする。
+    """
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    if schema is None:
+        schema = pa.schema([
+            field.with_type(pa.dictionary(pa.int32(), field.type.value_type))
+            if pa.types.is_dictionary(field.type) else field
+            for field in table.schema
+        ])
+    return table.cast(schema)
+
+
+def to_dataset_table(df: pd.DataFrame) -> pa.Table:
+    """
+    データセット用のArrowテーブルに変換する。ノードIDはファイルによらず同じ型になるようint32とする。
+    """
+    table = to_arrow_table(df)
+    field_index = table.schema.get_field_index("ノードID")
+    return table.set_column(field_index, "ノードID", table.column(field_index).cast(pa.int32()))
+
+
+def _make_dirs(path: str) -> None:
+    output_dir = os.path.dirname(path)
+    if output_dir:
+        os.makedirs(output_dir, exist_ok=True)
+
+
+def _part_path(target: OutputTarget, part_index: int) -> str:
+    return os.path.join(os.path.dirname(target.parquet_path), f'part-{part_index}.parquet')
+
+
+def _remove_stale_parts(target: OutputTarget) -> None:
+    """
+    データセットのパーティションに残っている追記分のParquet(part-1以降)を削除する。
+    """
+    partition_dir = os.path.dirname(target.parquet_path)
+    for part_path in glob.glob(os.path.join(partition_dir, 'part-*.parquet')):
+        if os.path.abspath(part_path) != os.path.abspath(target.parquet_path):
+            os.remove(part_path)
+
+
+def _csv_frame(df: pd.DataFrame, time_text: Optional[np.ndarray]) -> pd.DataFrame:
+    """
+    CSVに書き出すデータ。time_textを指定した場合、TIMEはロガーCSVに書かれていたままの文字列とする。
+    """
+    if time_text is None:
+        return df
+    df_csv = df.copy(deep=False)
+    df_csv["TIME"] = time_text
+    return df_csv
+
+
+def write_long_frame(df: pd.DataFrame, target: OutputTarget, timer: Optional[StageTimer] = None,
+                     time_text: Optional[np.ndarray] = None) -> None:
+    """
+    縦持ちデータ(またはセンサ種別ごとの横持ちデータ)を出力先に書き出す。
+    timerを指定した場合はwrite_csv, write_parquetの処理時間を積算する。
+    time_textはCSVに書き出すTIMEの文字列(ScaledFile.long_time_textなど。Noneの場合はTIMEを書式に従って書き出す)。
+    """
+    timer = timer or StageTimer()
+    if target.csv_path is not None:
+        with timer.stage("write_csv"):
+            _make_dirs(target.csv_path)
+            _csv_frame(df, time_text).to_csv(target.csv_path, index=False, encoding=OUTPUT_CSV_ENCODING, date_format=LOGGER_TIME_FORMAT)
+    with timer.stage("write_parquet"):
+        _make_dirs(target.parquet_path)
+        if target.dataset:
+            _remove_stale_parts(target)
+            pq.write_table(to_dataset_table(df), target.parquet_path, row_group_size=target.row_group_size)
+        else:
+            pq.write_table(to_arrow_table(df), target.parquet_path)
+
+
+def append_long_frame(df: pd.DataFrame, target: OutputTarget, part_index: int,
+                      timer: Optional[StageTimer] = None, time_text: Optional[np.ndarray] = None) -> None:
+    """
+    既存の出力に縦持ちデータ(またはセンサ種別ごとの横持ちデータ)を追記する。
+    CSVは末尾に追記し、データセットはpart-{part_index}.parquetとして書き出す。
+    ファイルごとのParquetは追記できないため、既存の内容と結合して書き直す(既存の行数に比例して時間がかかる。
+    追記分の行数だけで済ませる場合はデータセットを使う)。pandasに戻さずArrowテーブルのまま結合する。
+    """
+    timer = timer or StageTimer()
+    if target.csv_path is not None:
+        with timer.stage("write_csv"):
+            df_csv = _csv_frame(df, time_text)
+            if os.path.exists(target.csv_path):
+                df_csv.to_csv(target.csv_path, mode='a', index=False, header=False, encoding=OUTPUT_CSV_ENCODING,
+                              date_format=LOGGER_TIME_FORMAT)
+            else:
+                _make_dirs(target.csv_path)
+                df_csv.to_csv(target.csv_path, index=False, encoding=OUTPUT_CSV_ENCODING,
+                              date_format=LOGGER_TIME_FORMAT)
+    if not target.dataset and not os.path.exists(target.parquet_path):
+        write_long_frame(df, target._replace(csv_path=None), timer)
+        return
+    with timer.stage("write_parquet"):
+        if target.dataset:
+            _make_dirs(target.parquet_path)
+            pq.write_table(to_dataset_table(df), _part_path(target, part_index), row_group_size=target.row_group_size)
+        else:
+            # 既存のスキーマに揃えて結合する(測定種別の辞書は行グループごとに異なってよい)
+            existing = pq.read_table(target.parquet_path)
+            table = pa.concat_tables([existing, to_arrow_table(df, existing.schema)])
+            pq.write_table(table, target.parquet_path)
+
+
+class LongFrameWriter:
+    """
+    縦持ちデータ(またはセンサ種別ごとの横持ちデータ)をチャンクごとにCSVとParquetへ追記する。
+    Parquetはrow_group_size行たまるごとに1つの行グループとして書き込む。
+    write()が一度も呼ばれなかった場合は何も出力しない。
+    """
+
+    def __init__(self, target: OutputTarget, timer: Optional[StageTimer] = None) -> None:
+        self.target = target
+        self.timer = timer or StageTimer()
+        self._started = False
+        self._csv_file: Optional[TextIO] = None
+        self._parquet_writer: Optional[pq.ParquetWriter] = None
+        self._schema: Optional[pa.Schema] = None
+        self._pending: List[pa.Table] = []
+        self._pending_rows = 0
+
+    def write(self, df: pd.DataFrame, time_text: Optional[np.ndarray] = None) -> None:
+        """
+        チャンクを書き込む。time_textはCSVに書き出すTIMEの文字列(write_long_frameと同じ)。
+        """
+        self._started = True
+        if df.empty:
+            return
+        if self._schema is None:
+            with self.timer.stage("write_parquet"):
+                table = self._to_table(df)
+                self._schema = table.schema
+                _make_dirs(self.target.parquet_path)
+                if self.target.dataset:
+                    _remove_stale_parts(self.target)
+                self._parquet_writer = pq.ParquetWriter(self.target.parquet_path, self._schema)
+            if self.target.csv_path is not None:
+                with self.timer.stage("write_csv"):
+                    _make_dirs(self.target.csv_path)
+                    self._csv_file = open(self.target.csv_path, 'w', encoding=OUTPUT_CSV_ENCODING, newline='')
+                    _csv_frame(df, time_text).to_csv(self._csv_file, index=False, date_format=LOGGER_TIME_FORMAT)
+        else:
+            with self.timer.stage("write_parquet"):
+                table = self._to_table(df, self._schema)
+            if self._csv_file is not None:
+                with self.timer.stage("write_csv"):
+                    _csv_frame(df, time_text).to_csv(self._csv_file, index=False, header=False,
+                                                     date_format=LOGGER_TIME_FORMAT)
+        self._pending.append(table)
+        self._pending_rows += table.num_rows
+        if self._pending_rows >= self.target.row_group_size:
+            with self.timer.stage("write_parquet"):
+                self._flush()
+
+    def _to_table(self, df: pd.DataFrame, schema: Optional[pa.Schema] = None) -> pa.Table:
+        if self.target.dataset:
+            return to_dataset_table(df)
+        return to_arrow_table(df, schema)
+
+    def _flush(self) -> None:
+        if not self._pending:
+            return
+        table = pa.concat_tables(self._pending).combine_chunks()
+        self._parquet_writer.write_table(table, row_group_size=self.target.row_group_size)
+        self._pending = []
+        self._pending_rows = 0
+
+    def close(self) -> None:
+        """
+        出力を閉じる。データのある行が1行もなかった場合は空のファイルを出力する。
+        """
+        if self._started and self._schema is None:
+            write_long_frame(empty_long_frame(), self.target, self.timer)
+        if self._parquet_writer is not None:
+            with self.timer.stage("write_parquet"):
+                self._flush()
+        self._close_files()
+
+    def _close_files(self) -> None:
+        if self._csv_file is not None:
+            self._csv_file.close()
+        if self._parquet_writer is not None:
+            self._parquet_writer.close()
+        self._csv_file = None
+        self._parquet_writer = None
+
+    def __enter__(self) -> "LongFrameWriter":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        if exc_type is None:
+            self.close()
+        else:
+            self._close_files()
@@ -2,10 +2,34 @@ import os
 import re
 import json
 import time
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import ExitStack, nullcontext
 from datetime import datetime
-from typing import List, Dict, Any
+from functools import partial
+from typing import Any, Callable, Dict, Iterable, List, NamedTuple, Optional, Tuple
 import pandas as pd
 
+from wsn_decoder import ScaleTable, SensTypeTable
+from wsn_engine import DEFAULT_VALUE_DTYPE, OUTPUT_SHAPES, VALUE_DTYPES, ScaledFile, scale_wide_frame
+from wsn_history import (
+    FileIdentity, IncrementalState, ProcessedFileHistory, content_identity, file_identity, log_file_key,
+    open_file_history
+)
+from wsn_layout import NodeLayout
+from wsn_metrics import FileMetrics, MetricsRecorder, StageTimer, profile_if, profile_stats
+from wsn_output import (
+    DEFAULT_ROW_GROUP_SIZE, OUTPUT_MODES, LongFrameWriter, OutputTarget,
+    append_long_frame, output_target, wide_output_target, write_long_frame
+)
+from wsn_presence import DEFAULT_SAMPLE_ROWS, NodePresenceCache, sample_populated_nodes
+from wsn_reader import (
+    INGEST_BACKENDS, ingest_layout, iter_logger_csv, parse_logger_bytes, read_complete_lines, read_header
+)
+from wsn_scanner import LogFolderScanner, ScannedFile, read_file_list, watch_log_folders
+from wsn_snapshot import EXCEL_WRITER_BACKENDS, LatestReadingsCollector, LatestValueStore, write_to_excel
+from wsn_source_cache import DEFAULT_CACHE_SIZE_MB, SourceCache
+
 # 設定ファイルの読み込み
 script_path = os.path.abspath(__file__)
 script_dir = os.path.dirname(script_path)
@@ -15,6 +39,7 @@ with open('setting/config.json', encoding="utf-8-sig") as config_file:
 LOGGING_DATA_PATH = config["LOGGING_DATA_PATH"]
 OUTPUT_FOLDER_PATH = config["OUTPUT_FOLDER_PATH"]
 PREPROCESSED_FILE_PATH = os.path.join(OUTPUT_FOLDER_PATH, 'preprocessed_file_history.json')
+HISTORY_DB_PATH = os.path.join(OUTPUT_FOLDER_PATH, 'preprocessed_file_history.db')
 SCALE_JSON_PATH = config["SCALE_JSON_PATH"]
 SENS_TYPE_JSON_PATH = config["SENS_TYPE_JSON_PATH"]
 CURRENT_DATA_EXCEL_FILE_PATH = config["CURRENT_DATA_EXCEL_FILE_PATH"]
@@ -22,46 +47,6 @@ CURRENT_SENSOR_READINGS_JSON = config["CURRENT_SENSOR_READINGS_JSON"]
 MANAGEMENT_LEDGER_PATH = config["MANAGEMENT_LEDGER_PATH"]
 MANAGEMENT_LEDGER_SHEET_NAME = config["MANAGEMENT_LEDGER_SHEET_NAME"]
 
-def generate_node_list(start_node_id: int, end_node_id: int) -> List[str]:
-    """
-    指定したノードID範囲のカラム名リストを生成する。
-    Args:
-        start_node_id (int): 開始ノードID
-        end_node_id (int): 終了ノードID
-    Returns:
-        List[str]: カラム名リスト
-    """
-    if not (1 <= start_node_id <= 9999 and 1 <= end_node_id <= 9999):
-        raise ValueError("Node IDs must be between 1 and 9999")
-    if start_node_id > end_node_id:
-        raise ValueError("Start node ID must be less than or equal to end node ID")
-    result = ["TIME"]
-    for node_id in range(start_node_id, end_node_id + 1):
-        node_prefix = f"ノード{node_id:04d}"
-        result.extend([
-            f"{node_prefix}:ノードID",
-            f"{node_prefix}:電波強度",
-            f"{node_prefix}:センサ種別"
-        ])
-        for i in range(1, 20):
-            result.extend([
-                f"{node_prefix}:値{i}",
-                f"{node_prefix}:スケール{i}",
-                f"{node_prefix}:単位{i}"
-            ])
-    return result
-
-def get_node_folders(logging_folder_path: str) -> List[str]:
-    """
-    指定フォルダ内の"node"で始まるサブフォルダのパス一覧を返す。
-    """
-    all_entries = os.listdir(logging_folder_path)
-    node_folders = [
-        os.path.join(logging_folder_path, entry) for entry in all_entries
-        if os.path.isdir(os.path.join(logging_folder_path, entry)) and entry.startswith("node")
-    ]
-    return node_folders
-
 def extract_node_ids(node_path: str) -> tuple[int, int]:
     """
     フォルダ名からノードID範囲を抽出する。
@@ -71,40 +56,6 @@ def extract_node_ids(node_path: str) -> tuple[int, int]:
         return int(match.group(1)), int(match.group(2))
     raise ValueError("The path does not contain a valid 'node' range.")
 
-def save_file_history(file_path: str, json_file_path: str = PREPROCESSED_FILE_PATH) -> None:
-    """
-    処理済みファイルの履歴をJSONに保存する。
-    """
-    data = {"preprocessed_file_path": []}
-    if os.path.exists(json_file_path):
-        with open(json_file_path, 'r') as json_file:
-            try:
-                data = json.load(json_file)
-            except json.JSONDecodeError:
-                pass
-    new_entry = {"file_name": os.path.basename(file_path), "file_path": file_path}
-    data["preprocessed_file_path"].append(new_entry)
-    with open(json_file_path, 'w+', encoding='utf-8') as json_file:
-        json.dump(data, json_file, indent=4, ensure_ascii=False)
-
-def is_file_processed(file_path: str, json_file_path: str = PREPROCESSED_FILE_PATH) -> bool:
-    """
-    ファイルが既に処理済みかどうかを判定する。
-    """
-    if not os.path.exists(json_file_path):
-        return False
-    try:
-        with open(json_file_path, 'r') as json_file:
-            data = json.load(json_file)
-            if "preprocessed_file_path" not in data:
-                return False
-            for entry in data["preprocessed_file_path"]:
-                if entry.get("file_path") == file_path:
-                    return True
-    except (json.JSONDecodeError, IOError) as e:
-        print(f"Error reading JSON file: {e}")
-    return False
-
 def load_sensor_ledger(path: str, sheet_name: str) -> pd.DataFrame:
     """
     センサ管理台帳を読み込む。
@@ -139,130 +90,431 @@ def initialize_sheet_dataframes(sensor_sheets: List[Dict[str, Any]], columns: Li
         if sheet.get('dataframe') is None:
             sheet['dataframe'] = pd.DataFrame(columns=columns)
 
-def add_sensor_data(sensor_sheets: List[Dict[str, Any]], df_result: pd.DataFrame, sensor_ledger: pd.DataFrame) -> None:
+class PipelineContext(NamedTuple):
     """
-    最新データを対応するシートに追加する。
+    ファイル処理に必要な設定値。ワーカープロセスへ渡すため軽量に保つ。
     """
-    if df_result.empty:
-        print("df_resultが空です。処理を中断します。")
-        return
-    last_row = df_result.tail(1).copy()
-    current_id = last_row['ノードID'].iloc[0]
-    sensor_info = sensor_ledger[sensor_ledger['ID'] == current_id]
-    if sensor_info.empty:
-        print(f"センサーID {current_id} がセンサ管理台帳に存在しません。")
-        return
-    sens_type = sensor_info['センサ種別'].iat[0]
-    measurement_target = sensor_info['測定対象'].iat[0]
-    if pd.isnull(sens_type) or str(sens_type).strip() == "":
-        return
-    last_row.insert(loc=2, column='測定対象', value=measurement_target)
-    cleaned_sensor_type = str(sens_type).replace("/", "")
-    target_sheet = next((sheet for sheet in sensor_sheets if sheet.get('sheet_name') == cleaned_sensor_type), None)
-    if target_sheet is None:
-        print(f"センサ種別 '{sens_type}' に対応するシートが見つかりません。")
-        return
-    if target_sheet.get('dataframe') is None:
-        target_sheet['dataframe'] = last_row.reset_index(drop=True)
+    scale_table: ScaleTable
+    sens_table: SensTypeTable
+    today: str
+    output_folder_path: str
+    chunk_rows: int = 0
+    output_mode: str = "files"
+    write_csv: bool = True
+    row_group_size: int = DEFAULT_ROW_GROUP_SIZE
+    incremental: bool = False
+    profile: bool = False
+    value_dtype: str = DEFAULT_VALUE_DTYPE
+    output_shapes: Tuple[str, ...] = ("long",)
+    ingest: str = "pandas"
+    sparse_sample_rows: int = 0
+
+class FileTask(NamedTuple):
+    """
+    処理対象のファイル。incremental_stateは前回までの当日分の処理位置。
+    read_pathは実際に読み込むファイル(ソースキャッシュを使う場合のローカルのコピー)。
+    known_nodesは同じノードフォルダで過去にデータのあったノード(疎なノードの事前確認を行う場合)。
+    """
+    file_path: str
+    start_node: int
+    end_node: int
+    incremental_state: Optional[IncrementalState] = None
+    read_path: Optional[str] = None
+    known_nodes: Tuple[int, ...] = ()
+
+class FileResult(NamedTuple):
+    """
+    1ファイルの処理結果。履歴と最新値の反映は親プロセスで行う。
+    incremental_stateは当日分を途中まで処理した場合の処理位置(完了した場合はNone)。
+    metricsは段階ごとの処理時間、profile_statsはcProfileの結果(計測した場合のみ)。
+    populated_nodesはデータのあったノード。invalid_time_rowsはTIMEが空・書式が異なるため出力しなかった行数。
+    """
+    file_path: str
+    yyyymmdd: str
+    latest_rows: List[Dict[str, Any]]
+    unknown_scale_codes: int = 0
+    incremental_state: Optional[IncrementalState] = None
+    identity: Optional[FileIdentity] = None
+    metrics: Optional[FileMetrics] = None
+    profile_stats: Optional[dict] = None
+    populated_nodes: Tuple[int, ...] = ()
+    invalid_time_rows: int = 0
+
+def scaled_outputs(context: PipelineContext, task: FileTask, yyyymmdd: str,
+                   scaled_file: ScaledFile) -> List[Tuple[OutputTarget, pd.DataFrame, Any]]:
+    """
+    スケール変換結果から、context.output_shapesで指定した形のデータとその出力先、
+    CSVに書き出すTIMEの文字列(ロガーCSVに書かれていたまま)の組を返す。
+    """
+    outputs = []
+    if scaled_file.long is not None:
+        outputs.append((output_target(
+            context.output_folder_path, task.start_node, task.end_node, yyyymmdd,
+            context.output_mode, context.write_csv, context.row_group_size
+        ), scaled_file.long, scaled_file.long_time_text))
+    for sens_code, df_wide in (scaled_file.wide or {}).items():
+        outputs.append((wide_output_target(
+            context.output_folder_path, task.start_node, task.end_node, yyyymmdd, sens_code,
+            context.output_mode, context.write_csv, context.row_group_size
+        ), df_wide, (scaled_file.wide_time_text or {}).get(sens_code)))
+    return outputs
+
+def process_incremental(context: PipelineContext, task: FileTask, layout: NodeLayout,
+                        yyyymmdd: str, timer: StageTimer) -> FileResult:
+    """
+    前回の処理位置以降に追記された行だけをスケール変換し、出力に追記する。
+    処理位置がない場合はファイル全体を処理する。日付が変わったファイルは
+    残りの行を処理して完了とする。
+    """
+    file_path = task.file_path
+    read_path = task.read_path or file_path
+    state = task.incremental_state
+    finalize = yyyymmdd != context.today
+    if state is not None and os.path.getsize(read_path) < state.byte_offset:
+        print(f"ファイルが前回より小さくなったため最初から処理します: {file_path}")
+        state = None
+    with timer.stage("read"):
+        if state is None:
+            start_offset = 0
+            data, byte_offset = read_complete_lines(read_path, start_offset, complete_only=not finalize)
+            df = parse_logger_bytes(data, True, context.ingest, layout)
+            df_new = df
+            part_count = 0
+        else:
+            # 前回の最終行から読み込み、新しい行がない場合でも最新値を取れるようにする
+            has_last_line = state.last_line_offset is not None
+            start_offset = state.last_line_offset if has_last_line else state.byte_offset
+            data, byte_offset = read_complete_lines(read_path, start_offset, complete_only=not finalize)
+            df = parse_logger_bytes(data, False, context.ingest, layout)
+            df_new = df.iloc[1:] if has_last_line else df
+            part_count = state.part_count
+
+    latest_rows = []
+    unknown_scale_codes = 0
+    invalid_time_rows = 0
+    output_rows = 0
+    populated_nodes = ()
+    if len(df_new):
+        scaled_file = scale_wide_frame(df_new, layout, context.scale_table, context.sens_table, timer,
+                                       context.value_dtype, context.output_shapes)
+        unknown_scale_codes = scaled_file.unknown_scale_codes
+        invalid_time_rows = scaled_file.invalid_time_rows
+        latest_rows = scaled_file.latest_rows
+        populated_nodes = scaled_file.populated_nodes
+        if scaled_file.latest_rows:
+            for target, df_out, time_text in scaled_outputs(context, task, yyyymmdd, scaled_file):
+                output_rows += len(df_out)
+                if state is None:
+                    write_long_frame(df_out, target, timer, time_text)
+                else:
+                    append_long_frame(df_out, target, part_count, timer, time_text)
+            part_count += 1
+    elif len(df):
+        scaled_file = scale_wide_frame(df, layout, context.scale_table, context.sens_table, timer,
+                                       context.value_dtype, shapes=())
+        latest_rows = scaled_file.latest_rows
+        populated_nodes = scaled_file.populated_nodes
+    metrics = FileMetrics(file_path, "incremental", len(df_new), output_rows, {}, 0.0)
+
+    if finalize:
+        with timer.stage("history"):
+            identity = file_identity(read_path)
+        return FileResult(file_path, yyyymmdd, latest_rows, unknown_scale_codes, identity=identity, metrics=metrics,
+                          populated_nodes=populated_nodes, invalid_time_rows=invalid_time_rows)
+    if len(df):
+        last_line_offset = start_offset + data.rfind(b'\n', 0, len(data) - 1) + 1
+        last_time = str(df.iloc[-1, 0])
     else:
-        target_sheet['dataframe'] = pd.concat([
-            target_sheet['dataframe'], last_row
-        ], ignore_index=True)
+        last_line_offset = state.last_line_offset if state is not None else None
+        last_time = state.last_time if state is not None else None
+    new_state = IncrementalState(file_path, byte_offset, last_line_offset, last_time, part_count)
+    return FileResult(file_path, yyyymmdd, latest_rows, unknown_scale_codes, new_state, metrics=metrics,
+                      populated_nodes=populated_nodes, invalid_time_rows=invalid_time_rows)
 
-def write_to_excel(sensor_sheets: List[Dict[str, Any]], output_path: str) -> None:
+def select_layout(context: PipelineContext, task: FileTask, timer: StageTimer) -> NodeLayout:
     """
-    すべてのシートのデータフレームをエクセルファイルに書き出す。
+    読み込むカラムの配置を決める。カラム配置はファイルのカラム名行から求める(同じカラム名行は2回目以降キャッシュを使う)。
+    カラム名行がまだ書き込まれていない場合はフォルダ名のノードID範囲の配置とする。
+    context.sparse_sample_rowsが指定されている場合は、データ行の一部を事前に確認してデータのあったノードと、
+    過去にデータのあったノード(task.known_nodes)のカラムだけを読み込む。どちらもない場合は全ノードを読み込む。
     """
-    try:
-        with pd.ExcelWriter(output_path, engine='openpyxl') as writer:
-            for sheet in sensor_sheets:
-                sheet_name = sheet.get('sheet_name', 'Unnamed_Sheet')
-                df = sheet.get('dataframe')
-                if df is None:
-                    print(f"警告: シート '{sheet_name}' のデータフレームが None です。空のシートを作成します。")
-                    pd.DataFrame(columns=[]).to_excel(writer, sheet_name=sheet_name, index=False)
+    read_path = task.read_path or task.file_path
+    with timer.stage("prescan"):
+        header = read_header(read_path)
+        header = header if header.endswith(b'\n') else None
+        if not context.sparse_sample_rows:
+            return ingest_layout(task.start_node, task.end_node, context.ingest, header=header)
+        full_layout = ingest_layout(task.start_node, task.end_node, header=header)
+        nodes = sample_populated_nodes(read_path, full_layout, context.sparse_sample_rows)
+    nodes |= set(task.known_nodes)
+    if not nodes:
+        return ingest_layout(task.start_node, task.end_node, context.ingest, header=header)
+    return ingest_layout(task.start_node, task.end_node, context.ingest, nodes, header)
+
+def convert_file(context: PipelineContext, task: FileTask, timer: StageTimer) -> FileResult:
+    """
+    ロガーCSVを1ファイル読み込み、スケール変換した縦持ちデータを出力する。
+    context.chunk_rowsが指定されている場合はその行数ずつ読み込んで出力に追記する。
+    context.incrementalが指定されている場合、当日分は前回以降の追記分だけを処理する。
+    """
+    file_path, start_node, end_node = task.file_path, task.start_node, task.end_node
+    read_path = task.read_path or file_path
+    layout = select_layout(context, task, timer)
+    preprocessing_file = os.path.basename(file_path)
+    yyyymmdd = preprocessing_file.split('_')[-1].split('.')[0]
+    print(f"処理開始: {preprocessing_file}")
+    if context.incremental and (yyyymmdd == context.today or task.incremental_state is not None):
+        return process_incremental(context, task, layout, yyyymmdd, timer)
+    if context.chunk_rows:
+        # ノードごとに、そのノードのデータがあった最後のチャンクの最新値を残す
+        latest_by_node: Dict[Any, Dict[str, Any]] = {}
+        unknown_scale_codes = 0
+        invalid_time_rows = 0
+        rows = 0
+        output_rows = 0
+        populated_nodes = set()
+        chunks = iter_logger_csv(read_path, context.chunk_rows, context.ingest, layout)
+        # 出力先ごとのwriterは、その出力先のデータが最初に出てきたときに作成する
+        writers: Dict[str, LongFrameWriter] = {}
+        with ExitStack() as stack:
+            while True:
+                with timer.stage("read"):
+                    chunk = next(chunks, None)
+                if chunk is None:
+                    break
+                if not len(chunk):
                     continue
-                if not isinstance(df, pd.DataFrame):
-                    print(f"警告: シート '{sheet_name}' のデータは DataFrame ではありません。スキップします。")
+                rows += len(chunk)
+                scaled_file = scale_wide_frame(chunk, layout, context.scale_table, context.sens_table, timer,
+                                               context.value_dtype, context.output_shapes)
+                unknown_scale_codes += scaled_file.unknown_scale_codes
+                invalid_time_rows += scaled_file.invalid_time_rows
+                populated_nodes.update(scaled_file.populated_nodes)
+                if not scaled_file.latest_rows:
                     continue
-                df.to_excel(writer, sheet_name=sheet_name, index=False)
-        print(f"データをエクセルファイル '{output_path}' に出力しました。")
-    except Exception as e:
-        print(f"エクセルファイルへの書き出し中にエラーが発生しました: {e}")
-        raise
+                for target, df_out, time_text in scaled_outputs(context, task, yyyymmdd, scaled_file):
+                    writer = writers.get(target.parquet_path)
+                    if writer is None:
+                        writer = writers[target.parquet_path] = stack.enter_context(LongFrameWriter(target, timer))
+                    output_rows += len(df_out)
+                    writer.write(df_out, time_text)
+                latest_by_node.update((latest_row["ノードID"], latest_row) for latest_row in scaled_file.latest_rows)
+        latest_rows = list(latest_by_node.values())
+        with timer.stage("history"):
+            identity = file_identity(read_path) if yyyymmdd != context.today else None
+        metrics = FileMetrics(file_path, "chunked", rows, output_rows, {}, 0.0)
+        return FileResult(file_path, yyyymmdd, latest_rows, unknown_scale_codes, identity=identity, metrics=metrics,
+                          populated_nodes=tuple(sorted(populated_nodes)), invalid_time_rows=invalid_time_rows)
 
-today = datetime.today().strftime('%Y%m%d')
+    with timer.stage("read"):
+        data, _ = read_complete_lines(read_path, complete_only=False)
+        df = parse_logger_bytes(data, True, context.ingest, layout)
+    # 処理した内容そのものの識別子を記録し、後から書き換えられた場合に検出できるようにする
+    with timer.stage("history"):
+        identity = content_identity(file_path, data) if yyyymmdd != context.today else None
+    scaled_file = scale_wide_frame(df, layout, context.scale_table, context.sens_table, timer,
+                                   context.value_dtype, context.output_shapes)
+    if not scaled_file.latest_rows:
+        metrics = FileMetrics(file_path, "full", len(df), 0, {}, 0.0)
+        return FileResult(file_path, yyyymmdd, [], scaled_file.unknown_scale_codes, identity=identity, metrics=metrics,
+                          invalid_time_rows=scaled_file.invalid_time_rows)
+    output_rows = 0
+    for target, df_out, time_text in scaled_outputs(context, task, yyyymmdd, scaled_file):
+        write_long_frame(df_out, target, timer, time_text)
+        output_rows += len(df_out)
+    metrics = FileMetrics(file_path, "full", len(df), output_rows, {}, 0.0)
+    return FileResult(file_path, yyyymmdd, scaled_file.latest_rows, scaled_file.unknown_scale_codes,
+                      identity=identity, metrics=metrics, populated_nodes=scaled_file.populated_nodes,
+                      invalid_time_rows=scaled_file.invalid_time_rows)
 
-with open(SCALE_JSON_PATH, 'r', encoding='utf-8') as file:
-    df_scale = pd.DataFrame(json.load(file))
+def process_file(context: PipelineContext, task: FileTask) -> FileResult:
+    """
+    1ファイルを処理し、段階ごとの処理時間(context.profileの場合はcProfileの結果も)を結果に付ける。
+    """
+    timer = StageTimer()
+    s_time = time.perf_counter()
+    with profile_if(context.profile) as profiler:
+        result = convert_file(context, task, timer)
+    metrics = result.metrics._replace(stages=timer.seconds, total=time.perf_counter() - s_time)
+    return result._replace(metrics=metrics, profile_stats=profile_stats(profiler))
 
-sensor_ledger = load_sensor_ledger(MANAGEMENT_LEDGER_PATH, MANAGEMENT_LEDGER_SHEET_NAME)
-sensor_sheets = load_sensor_sheets(CURRENT_SENSOR_READINGS_JSON)
-clean_sheet_names(sensor_sheets)
-df_sens_type = pd.read_json(SENS_TYPE_JSON_PATH, encoding="utf-8")
-node_folders = get_node_folders(LOGGING_DATA_PATH)
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="WSNロガーCSVの前処理")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="ファイルを並列処理するプロセス数(1の場合は逐次処理)")
+    parser.add_argument("--chunk-rows", type=int, default=0,
+                        help="ロガーCSVを指定行数ずつ読み込んで出力に追記する(0の場合は一括読み込み)")
+    parser.add_argument("--output-mode", choices=OUTPUT_MODES, default="files",
+                        help="files: ファイルごとのCSV+Parquet, dataset: ノード範囲/日付で分割したParquetデータセット")
+    parser.add_argument("--ingest", choices=INGEST_BACKENDS, default="pandas",
+                        help="ロガーCSVの読み込み方式(arrow: pyarrow.csvでスケール変換に使うカラムだけを読み込む)")
+    parser.add_argument("--sparse-nodes", action="store_true",
+                        help="データ行の一部を事前に確認し、データのあるノード(過去にデータのあったノードを含む)のカラムだけを読み込む")
+    parser.add_argument("--sparse-sample-rows", type=int, default=DEFAULT_SAMPLE_ROWS,
+                        help="--sparse-nodesで事前に確認するデータ行数")
+    parser.add_argument("--skip-csv", action="store_true", help="shift-jisのCSVを出力しない")
+    parser.add_argument("--output-shape", nargs="+", choices=OUTPUT_SHAPES, default=["long"],
+                        help="long: 縦持ち(TIME, ノードID, 測定種別, 測定値), "
+                             "wide: センサ種別ごとの横持ち(TIME, ノードID, 測定種別名...)。両方指定できる")
+    parser.add_argument("--row-group-size", type=int, default=DEFAULT_ROW_GROUP_SIZE,
+                        help="Parquetの1行グループあたりの行数")
+    parser.add_argument("--value-dtype", choices=VALUE_DTYPES, default=DEFAULT_VALUE_DTYPE,
+                        help="縦持ちデータの測定値の型(float64は変換前と同じ精度)")
+    parser.add_argument("--incremental", action="store_true",
+                        help="当日分のファイルは前回以降に追記された行だけを処理する"
+                             "(--output-mode filesのParquetは追記のたびに既存の内容ごと書き直すため、"
+                             "追記の時間をファイルの大きさによらず一定にする場合はdatasetを使う)")
+    parser.add_argument("--file-list",
+                        help="フォルダをスキャンせず、このファイル一覧(create_dir.pyの--manifest)のファイルを処理する")
+    parser.add_argument("--source-cache",
+                        help="LOGGING_DATA_PATH(共有フォルダ)から直接読み込み、処理するファイルをこのフォルダにキャッシュする")
+    parser.add_argument("--source-cache-size", type=int, default=DEFAULT_CACHE_SIZE_MB,
+                        help="ソースキャッシュの上限サイズ[MB]")
+    parser.add_argument("--watch", action="store_true",
+                        help="処理後もロガーフォルダを監視し、変更があるたびに処理する(Linuxではinotifyを使用)")
+    parser.add_argument("--watch-interval", type=float, default=30.0,
+                        help="監視時に変更をまとめる時間、またはinotifyが使えない場合の確認間隔[s]")
+    parser.add_argument("--metrics",
+                        help="ファイルごとの段階別の処理時間をJSON Lines形式で追記するファイル")
+    parser.add_argument("--profile-slowest", type=int, default=0,
+                        help="cProfileで計測し、処理時間の長いファイルからこの件数の結果を保存する")
+    parser.add_argument("--profile-dir", default="profile",
+                        help="--profile-slowestの結果(.prof)の保存先")
+    parser.add_argument("--excel-writer", choices=EXCEL_WRITER_BACKENDS, default="openpyxl",
+                        help="最新値エクセルファイルの書き出し方式")
+    parser.add_argument("--snapshot-only", action="store_true",
+                        help="ロガーCSVを処理せず、記録済みの当日の最新値からエクセルファイルだけを作成する")
+    return parser.parse_args()
 
-for node_folder in node_folders:
-    start_node, end_node = extract_node_ids(node_folder)
-    file_list = os.listdir(node_folder)
-    for preprocessing_file in file_list:
-        file_path = os.path.join(node_folder, preprocessing_file)
-        if is_file_processed(file_path):
-            continue
-        s_time = time.time()
-        print(f"処理開始: {os.path.basename(preprocessing_file)}")
-        data = pd.read_csv(file_path, encoding='cp932', skiprows=2)
-        df = data.copy()
-        read_time = time.time() - s_time
-        yyyymmdd = preprocessing_file.split('_')[-1].split('.')[0]
-        new_columns = generate_node_list(start_node, end_node)
-        if len(new_columns) < df.shape[1]:
-            new_columns.extend(df.columns[len(new_columns):])
-        df.columns = new_columns
-        df_tmp_time = df.TIME.copy()
-        df_scaled = pd.DataFrame()
-        for node_id in range(start_node, end_node + 1):
-            df_tmp = df.loc[:, df.columns.str.contains(f'{node_id:04d}')].copy()
-            if df_tmp.iloc[:, 0].isnull().all():
-                continue
-            df_filtered_sens_type = df_sens_type[df_sens_type['sens_code_dec'] == df_tmp.iloc[-1, 2]]
-            df_filtered_sens_columns = list(filter(lambda x: not pd.isna(x), df_filtered_sens_type.values.flatten().tolist()))[3:]
-            value_columns = [col for col in df_tmp.columns if "値" in col][:len(df_filtered_sens_columns)]
-            scale_columns = [col for col in df_tmp.columns if "スケール" in col][:len(df_filtered_sens_columns)]
-            for v_col, s_col in zip(value_columns, scale_columns):
-                df_tmp[s_col] = df_tmp[s_col].astype(float)
-                df_tmp.loc[:, s_col] = df_tmp.loc[:, s_col].map(df_scale['scale'])
-            result = df_tmp.loc[:, scale_columns].values * df_tmp.loc[:, value_columns].values
-            df_tmp_scaled = pd.DataFrame(result, columns=df_tmp.loc[:, value_columns].columns, index=df_tmp.index)
-            df_tmp_scaled.columns = df_filtered_sens_columns
-            df_result = pd.concat([df_tmp_time, df_tmp.iloc[:, 0:2], df_tmp_scaled], axis=1)
-            df_result.rename(columns={f"ノード{node_id:04d}:ノードID": "ノードID"}, inplace=True)
-            df_result.rename(columns={f"ノード{node_id:04d}:電波強度": "電波強度[dB]"}, inplace=True)
-            if today == yyyymmdd:
-                add_sensor_data(sensor_sheets, df_result, sensor_ledger)
-            df_result_melt = df_result.melt(id_vars=["TIME", "ノードID"], var_name="測定種別", value_name="測定値")
-            df_scaled = pd.concat([df_scaled, df_result_melt], axis=0)
-        if df_scaled.shape == (0, 0):
-            if yyyymmdd == today:
+def write_snapshot(latest_rows: Iterable[Dict[str, Any]], excel_writer: str) -> None:
+    """
+    ノードの最新値をセンサ管理台帳のセンサ種別ごとのシートに振り分け、エクセルファイルに出力する。
+    """
+    sensor_ledger = load_sensor_ledger(MANAGEMENT_LEDGER_PATH, MANAGEMENT_LEDGER_SHEET_NAME)
+    sensor_sheets = load_sensor_sheets(CURRENT_SENSOR_READINGS_JSON)
+    clean_sheet_names(sensor_sheets)
+    latest_readings = LatestReadingsCollector(sensor_sheets, sensor_ledger)
+    for latest_row in latest_rows:
+        latest_readings.add(latest_row)
+    write_to_excel(latest_readings.materialize(), CURRENT_DATA_EXCEL_FILE_PATH, excel_writer)
+
+def preprocess(args: argparse.Namespace, context: PipelineContext, history: ProcessedFileHistory,
+               discover: Callable[[], List[ScannedFile]], source_cache: Optional[SourceCache] = None,
+               node_presence: Optional[NodePresenceCache] = None,
+               latest_values: Optional[LatestValueStore] = None) -> None:
+    """
+    discover(フォルダのスキャンまたはファイル一覧の読み込み)で見つかったファイルのうち
+    未処理のものを前処理し、当日の最新値をエクセルファイルに出力する。
+    source_cacheを指定した場合は、処理するファイルだけをキャッシュに取り込んでから読み込む。
+    node_presenceを指定した場合は、ノードフォルダごとにデータのあったノードを記録し、次回以降の読み込み対象に含める。
+    latest_valuesを指定した場合は、当日分の最新値をノードごとに記録し、今回処理しなかったノードを含めて
+    記録した最新値からエクセルファイルを作成する。
+    """
+    recorder = MetricsRecorder(args.metrics, args.profile_dir, args.profile_slowest)
+    with recorder.stage("discover"):
+        scanned_files = discover()
+
+    candidates = [(scanned_file, FileTask(scanned_file.file_path, *extract_node_ids(scanned_file.node_folder)))
+                  for scanned_file in scanned_files]
+    if source_cache is not None:
+        # 処理済みの内容との照合もローカルのコピーで行い、共有フォルダからの読み込みを1回で済ませる
+        with recorder.stage("fetch"):
+            local_paths = source_cache.fetch_many(task.file_path for _, task in candidates)
+        candidates = [(scanned_file, task._replace(read_path=local_paths[task.file_path]))
+                      for scanned_file, task in candidates if task.file_path in local_paths]
+
+    tasks = []
+    for scanned_file, task in candidates:
+        file_path = task.file_path
+        if log_file_key(file_path)[1] != context.today:
+            if history.is_processed_content(file_path, scanned_file.size, task.read_path):
+                # 移動・再同期されただけで内容が同じファイルは処理し直さない
+                if file_path not in history:
+                    print(f"処理済みの内容と同じためスキップします: {file_path}")
+                history.add(file_path)
                 continue
+            if file_path in history:
+                print(f"処理済みのファイルが書き換えられたため処理し直します: {file_path}")
+        incremental_state = history.incremental_state(file_path) if args.incremental else None
+        known_nodes = tuple(sorted(node_presence.known_nodes(scanned_file.node_folder))) if node_presence else ()
+        tasks.append(task._replace(incremental_state=incremental_state, known_nodes=known_nodes))
+
+    # 履歴と最新値の反映はタスクの順に親プロセスで行い、逐次処理と同じ結果にする
+    today_rows = []
+    worker = partial(process_file, context)
+    executor = ProcessPoolExecutor(max_workers=args.workers) if args.workers > 1 else None
+    with executor or nullcontext():
+        results = executor.map(worker, tasks) if executor else map(worker, tasks)
+        for result in results:
+            s_time = time.perf_counter()
+            if result.incremental_state is not None:
+                history.save_incremental_state(result.incremental_state)
             else:
-                save_file_history(file_path)
-                continue
-        else:
-            df_scaled = df_scaled.dropna()
-            df_scaled["ノードID"] = df_scaled["ノードID"].astype(int)
-        df_scaled.sort_values(by="TIME", inplace=True)
-        output_dir = os.path.join(OUTPUT_FOLDER_PATH, f'node{start_node}-{end_node}')
-        if not os.path.exists(output_dir):
-            os.makedirs(output_dir)
-        s_write_time = time.time()
-        output_csvfile_path = os.path.join(output_dir, f'node{start_node}-{end_node}_{yyyymmdd}')
-        df_scaled.to_csv(f'{output_csvfile_path}.csv', index=False, encoding='shift-jis')
-        df_scaled.to_parquet(f'{output_csvfile_path}.parquet', index=False)
-        write_time = time.time() - s_write_time
-        if yyyymmdd == today:
-            continue
+                history.clear_incremental_state(result.file_path)
+            if node_presence is not None:
+                node_presence.update(os.path.dirname(result.file_path), result.populated_nodes)
+            if result.unknown_scale_codes:
+                print(f"警告: {os.path.basename(result.file_path)} の未定義のスケールコード {result.unknown_scale_codes} 件をNaNとして扱いました。")
+            if result.invalid_time_rows:
+                print(f"警告: {os.path.basename(result.file_path)} のTIMEが空または書式が異なる {result.invalid_time_rows} 行を出力から除きました。")
+            if result.yyyymmdd == context.today:
+                if latest_values is not None:
+                    latest_values.update(result.yyyymmdd, result.latest_rows)
+                else:
+                    today_rows.extend(result.latest_rows)
+            else:
+                history.add(result.file_path, result.identity)
+            history_time = time.perf_counter() - s_time
+            stages = {**result.metrics.stages}
+            stages["history"] = stages.get("history", 0.0) + history_time
+            recorder.add_file(result.metrics._replace(stages=stages, total=result.metrics.total + history_time),
+                              result.profile_stats)
+    with recorder.stage("excel"):
+        if latest_values is not None:
+            today_rows = latest_values.rows(context.today)
+        write_snapshot(today_rows, args.excel_writer)
+    recorder.close()
+
+def main():
+    args = parse_args()
+
+    with open(SCALE_JSON_PATH, 'r', encoding='utf-8') as file:
+        df_scale = pd.DataFrame(json.load(file))
+    sens_table = SensTypeTable.from_frame(pd.read_json(SENS_TYPE_JSON_PATH, encoding="utf-8"))
+    context = PipelineContext(
+        ScaleTable.from_frame(df_scale), sens_table, datetime.today().strftime('%Y%m%d'), OUTPUT_FOLDER_PATH,
+        args.chunk_rows, args.output_mode, not args.skip_csv, args.row_group_size, args.incremental,
+        args.profile_slowest > 0, args.value_dtype, tuple(dict.fromkeys(args.output_shape)), args.ingest,
+        args.sparse_sample_rows if args.sparse_nodes else 0
+    )
+    source_cache = None
+    if args.source_cache:
+        source_cache = SourceCache(LOGGING_DATA_PATH, args.source_cache, args.source_cache_size * 1024 * 1024)
+    if args.snapshot_only:
+        with LatestValueStore(HISTORY_DB_PATH) as latest_values:
+            write_snapshot(latest_values.rows(context.today), args.excel_writer)
+        return
+    node_presence = NodePresenceCache(HISTORY_DB_PATH) if args.sparse_nodes else None
+    with open_file_history(HISTORY_DB_PATH, PREPROCESSED_FILE_PATH) as history, \
+            LogFolderScanner(HISTORY_DB_PATH, LOGGING_DATA_PATH) as scanner, \
+            LatestValueStore(HISTORY_DB_PATH) as latest_values, \
+            source_cache or nullcontext(), node_presence or nullcontext():
+        is_pending = lambda file_path: file_path not in history
+        if args.file_list:
+            preprocess(args, context, history, lambda: read_file_list(args.file_list), source_cache, node_presence,
+                       latest_values)
         else:
-            save_file_history(file_path)
-write_to_excel(sensor_sheets, CURRENT_DATA_EXCEL_FILE_PATH)
+            preprocess(args, context, history, lambda: scanner.scan(is_pending), source_cache, node_presence,
+                       latest_values)
+        if not args.watch:
+            return
+        print(f"ロガーフォルダの監視を開始します: {LOGGING_DATA_PATH}")
+        for changed_paths in watch_log_folders(LOGGING_DATA_PATH, args.watch_interval):
+            if changed_paths:
+                print(f"変更を検知しました: {len(changed_paths)} 件")
+            context = context._replace(today=datetime.today().strftime('%Y%m%d'))
+            preprocess(args, context, history, lambda: scanner.scan(is_pending), source_cache, node_presence,
+                       latest_values)
 
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,111 @@
+import os
+import time
+import sqlite3
+from typing import Dict, Iterable, List, Set
+
+import numpy as np
+
+from wsn_layout import NodeLayout
+from wsn_reader import LOGGER_PREAMBLE_ROWS
+
+# 事前確認で読み込むデータ行数の既定値(先頭行・最終行を含め、ファイル全体から等間隔に取る)
+DEFAULT_SAMPLE_ROWS = 64
+
+
+def sample_lines(file_path: str, sample_rows: int) -> List[bytes]:
+    """
+    ロガーCSVのデータ行をファイル全体から等間隔にsample_rows行程度読み込む。
+    先頭のデータ行と最後の(改行で終わる)データ行は必ず含める。
+    """
+    size = os.path.getsize(file_path)
+    lines = []
+    with open(file_path, 'rb') as f:
+        for _ in range(LOGGER_PREAMBLE_ROWS + 1):
+            f.readline()
+        data_start = f.tell()
+        if data_start >= size:
+            return lines
+        lines.append(f.readline())
+        # 各位置から次の行頭まで読み飛ばし、その次の1行を取る
+        for offset in np.linspace(data_start, size, num=max(sample_rows - 2, 0), endpoint=False)[1:]:
+            f.seek(int(offset))
+            f.readline()
+            line = f.readline()
+            if line.endswith(b'\n'):
+                lines.append(line)
+        # 最終行(書き込み途中の行は除く)
+        tail_size = min(size - data_start, 64 * 1024)
+        f.seek(size - tail_size)
+        tail = f.read(tail_size)
+        end = tail.rfind(b'\n')
+        if end > 0:
+            start = tail.rfind(b'\n', 0, end) + 1
+            if start > 0 or tail_size == size - data_start:
+                lines.append(tail[start:end + 1])
+    return lines
+
+
+def sample_populated_nodes(file_path: str, layout: NodeLayout, sample_rows: int = DEFAULT_SAMPLE_ROWS) -> Set[int]:
+    """
+    データ行の一部を読み込み、ノードIDの値がある行が1行でもあるノードを返す。
+    layoutはロガーCSVの全カラムの配置(get_node_layout)とする。
+    サンプルに含まれない行にだけデータがあるノードは検出できないため、呼び出し側で
+    過去に検出したノード(NodePresenceCache)と合わせて使う。
+    """
+    populated = np.zeros(layout.n_nodes, dtype=bool)
+    for line in sample_lines(file_path, sample_rows):
+        fields = line.rstrip(b'\r\n').split(b',')
+        if len(fields) < layout.n_columns:
+            continue
+        populated |= np.array([fields[pos].strip() not in (b'', b'""') for pos in layout.id_pos])
+    return set(layout.node_ids[populated].tolist())
+
+
+class NodePresenceCache:
+    """
+    ノードフォルダごとに、データのあったノードIDをSQLiteに記録する。
+    一度データのあったノードは、事前確認のサンプルに含まれなかった場合も読み込む対象とする。
+    """
+
+    def __init__(self, db_path: str) -> None:
+        db_dir = os.path.dirname(db_path)
+        if db_dir and not os.path.exists(db_dir):
+            os.makedirs(db_dir)
+        self._conn = sqlite3.connect(db_path)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS node_presence ("
+            " folder_path TEXT NOT NULL,"
+            " node_id INTEGER NOT NULL,"
+            " last_seen_ns INTEGER NOT NULL,"
+            " PRIMARY KEY (folder_path, node_id))"
+        )
+        self._conn.commit()
+        self._nodes: Dict[str, Set[int]] = {}
+        for folder_path, node_id in self._conn.execute("SELECT folder_path, node_id FROM node_presence"):
+            self._nodes.setdefault(folder_path, set()).add(node_id)
+
+    def known_nodes(self, folder_path: str) -> Set[int]:
+        return set(self._nodes.get(os.path.normpath(folder_path), ()))
+
+    def update(self, folder_path: str, node_ids: Iterable[int]) -> None:
+        folder_path = os.path.normpath(folder_path)
+        node_ids = set(node_ids)
+        if not node_ids:
+            return
+        now = time.time_ns()
+        with self._conn:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO node_presence (folder_path, node_id, last_seen_ns) VALUES (?, ?, ?)",
+                [(folder_path, node_id, now) for node_id in node_ids]
+            )
+        self._nodes.setdefault(folder_path, set()).update(node_ids)
+
+    def close(self) -> None:
+        self._conn.close()
+
+    def __enter__(self) -> "NodePresenceCache":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
@@ -0,0 +1,215 @@
+import io
+import csv
+import hashlib
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.csv as pacsv
+
+from wsn_layout import NodeLayout, get_node_layout, get_numeric_layout, layout_from_header, numeric_layout
+
+# ロガーCSVの文字コードと、カラム名行の前にあるメタデータ行の数
+LOGGER_ENCODING = 'cp932'
+LOGGER_PREAMBLE_ROWS = 2
+# ロガーCSVのTIMEの書式
+LOGGER_TIME_FORMAT = '%Y/%m/%d %H:%M:%S'
+# 読み込み方式: pandas=pd.read_csv(全カラム), arrow=pyarrow.csv(スケール変換に使うカラムのみ、型指定あり)
+INGEST_BACKENDS = ("pandas", "arrow")
+# arrowで分割して読み込む場合の1ブロックのバイト数
+ARROW_BLOCK_SIZE = 4 * 1024 * 1024
+
+# カラム名行のハッシュとフォルダ名のノードID範囲ごとの、ロガーCSVの全カラムの配置
+_header_layouts: Dict[Tuple[str, int, int], NodeLayout] = {}
+# カラム名行から求めた配置(generate_node_listと異なるもの)のうち、スケール変換に使うカラムだけの配置
+_header_numeric_layouts: Dict[Tuple[str, int, int, Optional[Tuple[int, ...]]], NodeLayout] = {}
+
+
+def read_header(file_path: str) -> bytes:
+    """
+    ロガーCSVのカラム名行(メタデータ行の次の行)を読み込む。
+    """
+    with open(file_path, 'rb') as f:
+        return [f.readline() for _ in range(LOGGER_PREAMBLE_ROWS + 1)][-1]
+
+
+def _header_key(header: bytes, start_node: int, end_node: int) -> Tuple[str, int, int]:
+    return hashlib.blake2b(header.rstrip(b'\r\n'), digest_size=16).hexdigest(), start_node, end_node
+
+
+def header_layout(header: bytes, start_node: int, end_node: int) -> NodeLayout:
+    """
+    カラム名行からロガーCSVの全カラムの配置を求める(layout_from_header)。
+    カラム名行のハッシュごとにキャッシュし、同じカラム名行のファイルではカラム名の解析を行わない。
+    """
+    key = _header_key(header, start_node, end_node)
+    layout = _header_layouts.get(key)
+    if layout is None:
+        columns = next(csv.reader([header.decode(LOGGER_ENCODING).rstrip('\r\n')]), [])
+        layout = _header_layouts[key] = layout_from_header(columns, start_node, end_node)
+    return layout
+
+
+def ingest_layout(start_node: int, end_node: int, backend: str = "pandas",
+                  nodes: Optional[Sequence[int]] = None, header: Optional[bytes] = None) -> NodeLayout:
+    """
+    読み込み方式に対応するカラム配置を返す。arrowは単位カラムを読み込まないため、列番号が異なる。
+    nodesを指定した場合は、どちらの方式でもそのノードのスケール変換に使うカラムだけを読み込む。
+    header(read_headerで読み込んだカラム名行)を指定した場合は、フォルダ名のノードID範囲ではなく
+    カラム名からカラム配置を求める。
+    """
+    if backend not in INGEST_BACKENDS:
+        raise ValueError(f"Unknown ingest backend: {backend}")
+    nodes = tuple(sorted(nodes)) if nodes is not None else None
+    if header is not None:
+        full_layout = header_layout(header, start_node, end_node)
+        if full_layout is not get_node_layout(start_node, end_node):
+            if nodes is None and backend == "pandas":
+                return full_layout
+            key = _header_key(header, start_node, end_node) + (nodes,)
+            layout = _header_numeric_layouts.get(key)
+            if layout is None:
+                layout = _header_numeric_layouts[key] = numeric_layout(full_layout, nodes)
+            return layout
+    if nodes is not None:
+        return get_numeric_layout(start_node, end_node, nodes)
+    if backend == "arrow":
+        return get_numeric_layout(start_node, end_node)
+    return get_node_layout(start_node, end_node)
+
+
+def _usecols(layout: Optional[NodeLayout]) -> Optional[List[int]]:
+    """
+    pandasで読み込むカラムの列番号。layoutがロガーCSVの全カラムの場合はNone(全カラム)とする。
+    """
+    if layout is None or layout.source_pos[-1] + 1 == len(layout.source_pos):
+        return None
+    return layout.source_pos.tolist()
+
+
+def read_logger_csv(file_path: str) -> pd.DataFrame:
+    """
+    ロガーCSVを一括で読み込む。
+    """
+    return pd.read_csv(file_path, encoding=LOGGER_ENCODING, skiprows=LOGGER_PREAMBLE_ROWS)
+
+
+def iter_logger_csv(file_path: str, chunk_rows: int, backend: str = "pandas",
+                    layout: Optional[NodeLayout] = None) -> Iterator[pd.DataFrame]:
+    """
+    ロガーCSVをchunk_rows行ずつ読み込む。メモリ使用量はファイルサイズではなく行数で決まる。
+    layout(ingest_layoutで取得したもの)がロガーCSVの一部のカラムの場合は、そのカラムだけを読み込む。
+    """
+    if backend == "arrow":
+        yield from _iter_arrow_csv(file_path, chunk_rows, layout)
+        return
+    with pd.read_csv(file_path, encoding=LOGGER_ENCODING, skiprows=LOGGER_PREAMBLE_ROWS,
+                     usecols=_usecols(layout), chunksize=chunk_rows) as reader:
+        for chunk in reader:
+            yield chunk
+
+
+def read_complete_lines(file_path: str, start_offset: int = 0, complete_only: bool = True) -> Tuple[bytes, int]:
+    """
+    start_offsetから最後の改行までのバイト列を読み込む。
+    complete_onlyがTrueの場合、書き込み途中の(改行で終わっていない)最終行は含めない。
+    Returns:
+        Tuple[bytes, int]: 読み込んだバイト列と、その終端のファイル上の位置
+    """
+    with open(file_path, 'rb') as f:
+        f.seek(start_offset)
+        data = f.read()
+    end = data.rfind(b'\n') + 1 if complete_only else len(data)
+    return data[:end], start_offset + end
+
+
+def parse_logger_bytes(data: bytes, with_preamble: bool, backend: str = "pandas",
+                       layout: Optional[NodeLayout] = None) -> pd.DataFrame:
+    """
+    read_complete_linesで読み込んだバイト列をDataFrameに変換する。
+    with_preambleがFalseの場合はデータ行のみとして扱う(pandasの場合、カラム名は列番号)。
+    layout(ingest_layoutで取得したもの)がロガーCSVの一部のカラムの場合は、そのカラムだけを読み込む。
+    """
+    if backend == "arrow":
+        if not data.strip():
+            return pd.DataFrame()
+        skip_rows = LOGGER_PREAMBLE_ROWS + 1 if with_preamble else 0
+        n_columns = _count_columns(_nth_line(data, skip_rows - 1 if with_preamble else 0))
+        table = pacsv.read_csv(pa.py_buffer(data), *_arrow_options(layout, n_columns, skip_rows))
+        return _arrow_to_frame(table, layout)
+    if with_preamble:
+        return pd.read_csv(io.BytesIO(data), encoding=LOGGER_ENCODING, skiprows=LOGGER_PREAMBLE_ROWS,
+                           usecols=_usecols(layout))
+    if not data.strip():
+        return pd.DataFrame()
+    return pd.read_csv(io.BytesIO(data), encoding=LOGGER_ENCODING, header=None, usecols=_usecols(layout))
+
+
+def _nth_line(data: bytes, index: int) -> bytes:
+    lines = data.split(b'\n', index + 1)
+    return lines[index] if index < len(lines) else b''
+
+
+def _count_columns(line: bytes) -> int:
+    """
+    CSVの1行(カラム名行またはデータ行)のカラム数を返す。
+    """
+    return len(next(csv.reader([line.decode(LOGGER_ENCODING).rstrip('\r\n')]), []))
+
+
+def _arrow_options(layout: NodeLayout, n_columns: int,
+                   skip_rows: int, block_size: Optional[int] = None) -> Tuple[pacsv.ReadOptions, pacsv.ParseOptions,
+                                                                          pacsv.ConvertOptions]:
+    """
+    pyarrow.csvの読み込み設定。カラム名行の代わりに列番号をカラム名とし、layoutのカラムだけを
+    TIMEは文字列、それ以外はfloat64として読み込む。カラム数が合わない行は警告してスキップする。
+    """
+    if n_columns < layout.source_pos[-1] + 1:
+        raise ValueError(
+            f"Length mismatch: node{layout.start_node}-{layout.end_node} requires "
+            f"{layout.source_pos[-1] + 1} columns, got {n_columns}"
+        )
+    read_options = pacsv.ReadOptions(
+        column_names=[str(pos) for pos in range(n_columns)], skip_rows=skip_rows, encoding=LOGGER_ENCODING,
+        **({"block_size": block_size} if block_size else {})
+    )
+
+    def skip_invalid_row(row) -> str:
+        print(f"警告: カラム数が合わない行をスキップしました(行 {row.number}: {row.actual_columns} 列)")
+        return 'skip'
+
+    parse_options = pacsv.ParseOptions(invalid_row_handler=skip_invalid_row)
+    names = [str(pos) for pos in layout.source_pos]
+    convert_options = pacsv.ConvertOptions(
+        include_columns=names,
+        column_types={name: pa.string() if pos == 0 else pa.float64() for name, pos in zip(names, layout.source_pos)},
+        strings_can_be_null=True,
+    )
+    return read_options, parse_options, convert_options
+
+
+def _arrow_to_frame(table: pa.Table, layout: NodeLayout) -> pd.DataFrame:
+    df = table.to_pandas()
+    df.columns = list(layout.columns)
+    return df
+
+
+def _iter_arrow_csv(file_path: str, chunk_rows: int, layout: NodeLayout) -> Iterator[pd.DataFrame]:
+    """
+    pyarrow.csvのストリーム読み込みで、chunk_rows行ずつのDataFrameを返す。
+    """
+    options = _arrow_options(layout, _count_columns(read_header(file_path)), LOGGER_PREAMBLE_ROWS + 1, ARROW_BLOCK_SIZE)
+    pending: List[pa.RecordBatch] = []
+    pending_rows = 0
+    with pacsv.open_csv(file_path, *options) as reader:
+        for batch in reader:
+            pending.append(batch)
+            pending_rows += batch.num_rows
+            while pending_rows >= chunk_rows:
+                table = pa.Table.from_batches(pending)
+                yield _arrow_to_frame(table.slice(0, chunk_rows), layout)
+                rest = table.slice(chunk_rows)
+                pending = rest.to_batches()
+                pending_rows = rest.num_rows
+    if pending_rows:
+        yield _arrow_to_frame(pa.Table.from_batches(pending), layout)
@@ -0,0 +1,319 @@
+import os
+import sys
+import time
+import select
+import sqlite3
+import struct
+import ctypes
+import ctypes.util
+from typing import Callable, Dict, Iterator, List, NamedTuple, Optional, Set, Tuple
+
+from create_dir import PARTIAL_SUFFIX
+
+# フォルダの更新日時がスキャン時刻からこの時間[ns]以内の場合は、同じ更新日時のまま
+# ファイルが追加される可能性があるため、次回も中身を確認する(更新日時の分解能が粗い共有フォルダ対策)
+RACY_MTIME_WINDOW_NS = 2 * 10**9
+# 処理対象のロガーCSVの拡張子(大文字・小文字は区別しない)
+LOGGER_FILE_SUFFIX = ".CSV"
+
+
+class ScannedFile(NamedTuple):
+    """
+    スキャンで見つかったファイル。changedは前回のスキャンから新規または(サイズ, 更新日時)が変わったか。
+    """
+    file_path: str
+    node_folder: str
+    size: int
+    mtime_ns: int
+    changed: bool
+
+
+def get_node_folders(logging_folder_path: str) -> List[str]:
+    """
+    指定フォルダ内の"node"で始まるサブフォルダのパス一覧を返す。
+    """
+    with os.scandir(logging_folder_path) as entries:
+        return [
+            entry.path for entry in entries
+            if entry.name.startswith("node") and entry.is_dir()
+        ]
+
+
+def is_logger_file(file_path: str) -> bool:
+    """
+    処理対象のロガーCSV(*.CSV、*.csv)かどうか。create_dir.pyが転送中のファイル(*.CSV.part)はFalse。
+    """
+    name = file_path.upper()
+    if name.endswith(PARTIAL_SUFFIX.upper()):
+        return False
+    return name.endswith(LOGGER_FILE_SUFFIX)
+
+
+def read_file_list(list_path: str) -> List[ScannedFile]:
+    """
+    ファイル一覧(1行に1パス、create_dir.pyの--manifestの出力)を読み込む。
+    存在しないファイルは警告してスキップする。一覧のファイルはすべて新規・更新として扱う。
+    """
+    scanned_files = []
+    with open(list_path, 'r', encoding='utf-8') as f:
+        for line in f:
+            file_path = line.strip()
+            if not file_path:
+                continue
+            if not is_logger_file(file_path):
+                print(f"警告: 一覧のロガーCSV(*{LOGGER_FILE_SUFFIX})でないファイル・転送中のファイル(*{PARTIAL_SUFFIX})は"
+                      f"スキップします: {file_path}")
+                continue
+            try:
+                stat = os.stat(file_path)
+            except FileNotFoundError:
+                print(f"警告: 一覧のファイルが見つかりません: {file_path}")
+                continue
+            scanned_files.append(ScannedFile(
+                file_path, os.path.dirname(file_path), stat.st_size, stat.st_mtime_ns, True
+            ))
+    print(f"ファイル一覧: {list_path} ({len(scanned_files)} 件)")
+    return scanned_files
+
+
+class LogFolderScanner:
+    """
+    ロガーフォルダのファイル一覧と(サイズ, 更新日時)をSQLiteにキャッシュし、変更のあったファイルを検出する。
+    更新日時が前回から変わっていないノードフォルダは一覧を取り直さず、キャッシュした一覧の
+    ファイルの(サイズ, 更新日時)だけを確認する。
+    """
+
+    def __init__(self, db_path: str, logging_folder_path: str) -> None:
+        db_dir = os.path.dirname(db_path)
+        if db_dir and not os.path.exists(db_dir):
+            os.makedirs(db_dir)
+        self.logging_folder_path = logging_folder_path
+        self._conn = sqlite3.connect(db_path)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS scan_folder ("
+            " folder_path TEXT PRIMARY KEY,"
+            " mtime_ns INTEGER NOT NULL,"
+            " scanned_at_ns INTEGER NOT NULL)"
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS scan_file ("
+            " file_path TEXT PRIMARY KEY,"
+            " folder_path TEXT NOT NULL,"
+            " position INTEGER NOT NULL,"
+            " size INTEGER NOT NULL,"
+            " mtime_ns INTEGER NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS scan_file_folder ON scan_file (folder_path, position)")
+        self._conn.commit()
+        self._folders: Dict[str, Tuple[int, int]] = {
+            row[0]: (row[1], row[2]) for row in self._conn.execute(
+                "SELECT folder_path, mtime_ns, scanned_at_ns FROM scan_folder"
+            )
+        }
+
+    def _cached_files(self, folder_path: str) -> List[Tuple[str, int, int]]:
+        return self._conn.execute(
+            "SELECT file_path, size, mtime_ns FROM scan_file WHERE folder_path = ? ORDER BY position",
+            (folder_path,)
+        ).fetchall()
+
+    def _folder_unchanged(self, folder_path: str, mtime_ns: int) -> bool:
+        cached = self._folders.get(folder_path)
+        if cached is None or cached[0] != mtime_ns:
+            return False
+        return cached[1] - mtime_ns >= RACY_MTIME_WINDOW_NS
+
+    def _rescan_folder(self, folder_path: str, mtime_ns: int,
+                       is_pending: Callable[[str], bool]) -> List[ScannedFile]:
+        """
+        ノードフォルダの一覧を取り直し、キャッシュを置き換える。
+        """
+        cached = {file_path: (size, mtime) for file_path, size, mtime in self._cached_files(folder_path)}
+        rows = []
+        scanned_files = []
+        with os.scandir(folder_path) as entries:
+            for entry in entries:
+                if not is_logger_file(entry.name) or not entry.is_file():
+                    continue
+                stat = entry.stat()
+                fingerprint = (stat.st_size, stat.st_mtime_ns)
+                rows.append((entry.path, folder_path, len(rows), *fingerprint))
+                previous = cached.get(entry.path)
+                changed = previous != fingerprint
+                # 処理済みのファイルも、前回のスキャンから書き換えられていれば返す
+                if is_pending(entry.path) or (previous is not None and changed):
+                    scanned_files.append(ScannedFile(entry.path, folder_path, *fingerprint, changed))
+        with self._conn:
+            self._conn.execute("DELETE FROM scan_file WHERE folder_path = ?", (folder_path,))
+            self._conn.executemany(
+                "INSERT INTO scan_file (file_path, folder_path, position, size, mtime_ns) VALUES (?, ?, ?, ?, ?)",
+                rows
+            )
+            self._save_folder(folder_path, mtime_ns)
+        return scanned_files
+
+    def _check_cached_folder(self, folder_path: str, is_pending: Callable[[str], bool]) -> List[ScannedFile]:
+        """
+        キャッシュした一覧のファイルの(サイズ, 更新日時)を確認し、未処理のファイルと、処理済みのうち
+        前回のスキャンから書き換えられたファイルを返す(同じ名前での上書き・追記ではフォルダの更新日時が変わらないため)。
+        """
+        scanned_files = []
+        updates = []
+        removed = []
+        for file_path, size, mtime_ns in self._cached_files(folder_path):
+            if not is_logger_file(file_path):
+                continue
+            try:
+                stat = os.stat(file_path)
+            except FileNotFoundError:
+                removed.append((file_path,))
+                continue
+            fingerprint = (stat.st_size, stat.st_mtime_ns)
+            changed = fingerprint != (size, mtime_ns)
+            if changed:
+                updates.append((*fingerprint, file_path))
+            if is_pending(file_path) or changed:
+                scanned_files.append(ScannedFile(file_path, folder_path, *fingerprint, changed))
+        if updates or removed:
+            with self._conn:
+                self._conn.executemany("UPDATE scan_file SET size = ?, mtime_ns = ? WHERE file_path = ?", updates)
+                self._conn.executemany("DELETE FROM scan_file WHERE file_path = ?", removed)
+        return scanned_files
+
+    def _save_folder(self, folder_path: str, mtime_ns: int) -> None:
+        scanned_at_ns = time.time_ns()
+        self._conn.execute(
+            "INSERT OR REPLACE INTO scan_folder (folder_path, mtime_ns, scanned_at_ns) VALUES (?, ?, ?)",
+            (folder_path, mtime_ns, scanned_at_ns)
+        )
+        self._folders[folder_path] = (mtime_ns, scanned_at_ns)
+
+    def scan(self, is_pending: Callable[[str], bool] = lambda file_path: True) -> List[ScannedFile]:
+        """
+        ノードフォルダ内のロガーCSVのうちis_pendingがTrueのもの(未処理のファイル)を返す。
+        処理済みのファイルも、前回のスキャンから(サイズ, 更新日時)が変わっていれば返す。
+        フォルダ・ファイルの順序はos.scandirの順序とする。
+        """
+        scanned_files = []
+        rescanned = 0
+        node_folders = get_node_folders(self.logging_folder_path)
+        for folder_path in node_folders:
+            mtime_ns = os.stat(folder_path).st_mtime_ns
+            if self._folder_unchanged(folder_path, mtime_ns):
+                scanned_files.extend(self._check_cached_folder(folder_path, is_pending))
+            else:
+                scanned_files.extend(self._rescan_folder(folder_path, mtime_ns, is_pending))
+                rescanned += 1
+        changed = sum(scanned_file.changed for scanned_file in scanned_files)
+        print(f"スキャン: ノードフォルダ {len(node_folders)} 件(一覧取得 {rescanned} 件), "
+              f"確認対象ファイル {len(scanned_files)} 件(新規・更新 {changed} 件)")
+        return scanned_files
+
+    def close(self) -> None:
+        self._conn.close()
+
+    def __enter__(self) -> "LogFolderScanner":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+
+class InotifyWatcher:
+    """
+    inotifyでロガーフォルダとノードフォルダの変更を監視する(Linuxのみ)。
+    ネットワーク共有(CIFS等)ではサーバ側の変更が通知されないことがある。
+    """
+    IN_MODIFY = 0x00000002
+    IN_CLOSE_WRITE = 0x00000008
+    IN_MOVED_FROM = 0x00000040
+    IN_MOVED_TO = 0x00000080
+    IN_CREATE = 0x00000100
+    IN_DELETE = 0x00000200
+    IN_Q_OVERFLOW = 0x00004000
+    IN_ISDIR = 0x40000000
+    WATCH_MASK = IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+    _EVENT_HEADER = struct.Struct('iIII')
+
+    def __init__(self, logging_folder_path: str) -> None:
+        libc_name = ctypes.util.find_library('c') or 'libc.so.6'
+        self._libc = ctypes.CDLL(libc_name, use_errno=True)
+        self._fd = self._libc.inotify_init1(os.O_CLOEXEC | os.O_NONBLOCK)
+        if self._fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self.logging_folder_path = logging_folder_path
+        self._paths: Dict[int, str] = {}
+        self._add_watch(logging_folder_path)
+        for folder_path in get_node_folders(logging_folder_path):
+            self._add_watch(folder_path)
+
+    def _add_watch(self, path: str) -> None:
+        wd = self._libc.inotify_add_watch(self._fd, os.fsencode(path), self.WATCH_MASK)
+        if wd < 0:
+            raise OSError(ctypes.get_errno(), f"inotify_add_watch failed: {path}")
+        self._paths[wd] = path
+
+    def read_events(self, timeout: Optional[float] = None) -> Set[str]:
+        """
+        timeout秒まで変更を待ち、変更のあったファイル・フォルダのパスを返す。
+        """
+        changed: Set[str] = set()
+        readable, _, _ = select.select([self._fd], [], [], timeout)
+        if not readable:
+            return changed
+        try:
+            data = os.read(self._fd, 65536)
+        except BlockingIOError:
+            return changed
+        offset = 0
+        while offset < len(data):
+            wd, mask, _, name_len = self._EVENT_HEADER.unpack_from(data, offset)
+            offset += self._EVENT_HEADER.size
+            name = os.fsdecode(data[offset:offset + name_len].rstrip(b'\0'))
+            offset += name_len
+            if mask & self.IN_Q_OVERFLOW:
+                changed.add(self.logging_folder_path)
+                continue
+            parent = self._paths.get(wd)
+            if parent is None:
+                continue
+            path = os.path.join(parent, name) if name else parent
+            changed.add(path)
+            if (mask & self.IN_ISDIR and mask & (self.IN_CREATE | self.IN_MOVED_TO)
+                    and parent == self.logging_folder_path and name.startswith("node")):
+                self._add_watch(path)
+        return changed
+
+    def close(self) -> None:
+        os.close(self._fd)
+
+
+def watch_log_folders(logging_folder_path: str, interval: float) -> Iterator[Set[str]]:
+    """
+    ロガーフォルダの変更を待ち、変更のあったパスの集合を返し続ける。
+    inotifyが使える場合は変更を検知してからinterval秒分の変更をまとめて返し、
+    使えない場合はinterval秒ごとに空の集合を返す(呼び出し側で再スキャンする)。
+    """
+    watcher = None
+    if sys.platform.startswith('linux'):
+        try:
+            watcher = InotifyWatcher(logging_folder_path)
+        except (OSError, AttributeError) as e:
+            print(f"inotifyが使用できないため {interval} 秒ごとに確認します: {e}")
+    else:
+        print(f"inotifyが使用できないため {interval} 秒ごとに確認します。")
+    try:
+        while True:
+            if watcher is None:
+                time.sleep(interval)
+                yield set()
+                continue
+            changed = watcher.read_events()
+            deadline = time.monotonic() + interval
+            while (remaining := deadline - time.monotonic()) > 0:
+                changed |= watcher.read_events(remaining)
+            yield changed
+    finally:
+        if watcher is not None:
+            watcher.close()
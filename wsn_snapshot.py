@@ -0,0 +1,267 @@
+import os
+import json
+import time
+import shutil
+import sqlite3
+import tempfile
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Tuple
+
+import numpy as np
+import pandas as pd
+
+# write_to_excelで選択できる書き出し方式
+EXCEL_WRITER_BACKENDS = ("openpyxl", "openpyxl-write-only", "xlsxwriter")
+
+
+class LatestReadingsCollector:
+    """
+    当日の各ノードの最新値をセンサ種別ごとのシートに振り分ける。
+    センサ管理台帳はIDで一度だけ索引化し、行はシートごとのリストに溜めて
+    materializeで一度にDataFrameへ変換する。
+    """
+
+    def __init__(self, sensor_sheets: List[Dict[str, Any]], sensor_ledger: pd.DataFrame) -> None:
+        self.sensor_sheets = sensor_sheets
+        self._ledger: Dict[Any, Tuple[Any, Any]] = {}
+        for sensor_id, sens_type, measurement_target in zip(
+                sensor_ledger['ID'], sensor_ledger['センサ種別'], sensor_ledger['測定対象']):
+            self._ledger.setdefault(sensor_id, (sens_type, measurement_target))
+        self._records: Dict[str, List[Dict[str, Any]]] = {
+            sheet['sheet_name']: [] for sheet in sensor_sheets
+        }
+
+    def add(self, latest_row: Dict[str, Any]) -> None:
+        """
+        ノードの最新値(TIME, ノードID, 電波強度[dB], 測定種別...)を対応するシートに追加する。
+        """
+        current_id = latest_row['ノードID']
+        sensor_info = self._ledger.get(current_id)
+        if sensor_info is None:
+            print(f"センサーID {current_id} がセンサ管理台帳に存在しません。")
+            return
+        sens_type, measurement_target = sensor_info
+        if pd.isnull(sens_type) or str(sens_type).strip() == "":
+            return
+        cleaned_sensor_type = str(sens_type).replace("/", "")
+        records = self._records.get(cleaned_sensor_type)
+        if records is None:
+            print(f"センサ種別 '{sens_type}' に対応するシートが見つかりません。")
+            return
+        items = list(latest_row.items())
+        items.insert(2, ('測定対象', measurement_target))
+        records.append(dict(items))
+
+    def materialize(self) -> List[Dict[str, Any]]:
+        """
+        溜めた行をシートごとのDataFrameに変換し、sensor_sheetsの'dataframe'に設定する。
+        """
+        for sheet in self.sensor_sheets:
+            records = self._records[sheet['sheet_name']]
+            if not records:
+                continue
+            df = pd.DataFrame.from_records(records)
+            if sheet.get('dataframe') is not None:
+                df = pd.concat([sheet['dataframe'], df], ignore_index=True)
+            sheet['dataframe'] = df
+            records.clear()
+        return self.sensor_sheets
+
+
+def _json_scalar(value: Any) -> Any:
+    """
+    json.dumpsで変換できない値(numpyの整数など)をPythonの値に変換する。
+    """
+    if isinstance(value, np.generic):
+        return value.item()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+class LatestValueStore:
+    """
+    ノードIDごとの最新値(TIME, 電波強度[dB], 測定種別ごとの値)をSQLiteに保持する。
+    当日分の処理結果が出るたびに更新し、エクセルの最新値はロガーCSVを読み直さずにここから作成する。
+    測定対象はセンサ管理台帳から取るため保持しない(LatestReadingsCollectorで付ける)。
+    """
+
+    def __init__(self, db_path: str) -> None:
+        db_dir = os.path.dirname(db_path)
+        if db_dir and not os.path.exists(db_dir):
+            os.makedirs(db_dir)
+        self._conn = sqlite3.connect(db_path)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS latest_values ("
+            " node_id INTEGER PRIMARY KEY,"
+            " yyyymmdd TEXT NOT NULL,"
+            " time TEXT NOT NULL,"
+            " measures TEXT NOT NULL,"
+            " updated_ns INTEGER NOT NULL)"
+        )
+        self._conn.commit()
+
+    def update(self, yyyymmdd: str, latest_rows: Iterable[Dict[str, Any]]) -> None:
+        """
+        ノードの最新値(TIME, ノードID, 電波強度[dB], 測定種別...)で更新する。
+        保持している値より古い(日付・TIMEが前の)行では更新しない。
+        """
+        now = time.time_ns()
+        records = []
+        for latest_row in latest_rows:
+            if pd.isna(latest_row['ノードID']) or pd.isna(latest_row['TIME']):
+                continue
+            measures = {key: value for key, value in latest_row.items() if key not in ('TIME', 'ノードID')}
+            records.append((int(latest_row['ノードID']), yyyymmdd, str(latest_row['TIME']),
+                            json.dumps(measures, ensure_ascii=False, default=_json_scalar), now))
+        if not records:
+            return
+        with self._conn:
+            self._conn.executemany(
+                "INSERT INTO latest_values (node_id, yyyymmdd, time, measures, updated_ns) VALUES (?, ?, ?, ?, ?)"
+                " ON CONFLICT(node_id) DO UPDATE SET yyyymmdd = excluded.yyyymmdd, time = excluded.time,"
+                " measures = excluded.measures, updated_ns = excluded.updated_ns"
+                " WHERE (excluded.yyyymmdd, excluded.time) >= (latest_values.yyyymmdd, latest_values.time)",
+                records
+            )
+
+    def rows(self, yyyymmdd: str) -> List[Dict[str, Any]]:
+        """
+        yyyymmddの最新値をノードID順に返す(処理結果のlatest_rowsと同じ形)。
+        """
+        cursor = self._conn.execute(
+            "SELECT node_id, time, measures FROM latest_values WHERE yyyymmdd = ? ORDER BY node_id", (yyyymmdd,)
+        )
+        return [{'TIME': time_text, 'ノードID': node_id, **json.loads(measures)}
+                for node_id, time_text, measures in cursor]
+
+    def close(self) -> None:
+        self._conn.close()
+
+    def __enter__(self) -> "LatestValueStore":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+
+def _iter_sheet_frames(sensor_sheets: List[Dict[str, Any]]) -> Iterator[Tuple[str, pd.DataFrame]]:
+    """
+    書き出すシート名とデータフレームを順に返す。データフレームがNoneのシートは空のシートとする。
+    """
+    for sheet in sensor_sheets:
+        sheet_name = sheet.get('sheet_name', 'Unnamed_Sheet')
+        df = sheet.get('dataframe')
+        if df is None:
+            print(f"警告: シート '{sheet_name}' のデータフレームが None です。空のシートを作成します。")
+            yield sheet_name, pd.DataFrame(columns=[])
+            continue
+        if not isinstance(df, pd.DataFrame):
+            print(f"警告: シート '{sheet_name}' のデータは DataFrame ではありません。スキップします。")
+            continue
+        yield sheet_name, df
+
+
+def _iter_sheet_rows(df: pd.DataFrame) -> Iterator[List[Any]]:
+    """
+    ヘッダ行とデータ行を順に返す。欠損値は空セルにするためNoneとする。
+    """
+    if len(df.columns) == 0:
+        return
+    yield [str(col) for col in df.columns]
+    values = df.astype(object).where(df.notna(), None)
+    for row in values.itertuples(index=False, name=None):
+        yield list(row)
+
+
+def _write_openpyxl(sheet_frames: Iterator[Tuple[str, pd.DataFrame]], output_path: str) -> Dict[str, float]:
+    sheet_times = {}
+    with pd.ExcelWriter(output_path, engine='openpyxl') as writer:
+        for sheet_name, df in sheet_frames:
+            s_time = time.perf_counter()
+            df.to_excel(writer, sheet_name=sheet_name, index=False)
+            sheet_times[sheet_name] = time.perf_counter() - s_time
+    return sheet_times
+
+
+def _write_openpyxl_write_only(sheet_frames: Iterator[Tuple[str, pd.DataFrame]], output_path: str) -> Dict[str, float]:
+    from openpyxl import Workbook
+
+    sheet_times = {}
+    workbook = Workbook(write_only=True)
+    for sheet_name, df in sheet_frames:
+        s_time = time.perf_counter()
+        worksheet = workbook.create_sheet(title=sheet_name)
+        for row in _iter_sheet_rows(df):
+            worksheet.append(row)
+        sheet_times[sheet_name] = time.perf_counter() - s_time
+    workbook.save(output_path)
+    return sheet_times
+
+
+def _write_xlsxwriter(sheet_frames: Iterator[Tuple[str, pd.DataFrame]], output_path: str) -> Dict[str, float]:
+    import xlsxwriter
+
+    sheet_times = {}
+    # constant_memoryでは行単位で書き込む必要があるため、pandasのto_excel(列単位)は使わない
+    with xlsxwriter.Workbook(output_path, {'constant_memory': True}) as workbook:
+        for sheet_name, df in sheet_frames:
+            s_time = time.perf_counter()
+            worksheet = workbook.add_worksheet(sheet_name)
+            for row_index, row in enumerate(_iter_sheet_rows(df)):
+                worksheet.write_row(row_index, 0, row)
+            sheet_times[sheet_name] = time.perf_counter() - s_time
+    return sheet_times
+
+
+_EXCEL_WRITERS: Dict[str, Callable[[Iterator[Tuple[str, pd.DataFrame]], str], Dict[str, float]]] = {
+    "openpyxl": _write_openpyxl,
+    "openpyxl-write-only": _write_openpyxl_write_only,
+    "xlsxwriter": _write_xlsxwriter,
+}
+
+
+def replace_file(local_path: str, output_path: str) -> None:
+    """
+    ローカルのファイルを出力先へ置き換える。出力先と同じフォルダに一時ファイルとして
+    コピーしてからos.replaceで置き換えるため、書き出し途中のファイルが見えることはない。
+    """
+    output_dir = os.path.dirname(os.path.abspath(output_path))
+    os.makedirs(output_dir, exist_ok=True)
+    staging_path = os.path.join(output_dir, f".{os.path.basename(output_path)}.tmp")
+    try:
+        shutil.copyfile(local_path, staging_path)
+        os.replace(staging_path, output_path)
+    finally:
+        if os.path.exists(staging_path):
+            os.remove(staging_path)
+
+
+def write_to_excel(sensor_sheets: List[Dict[str, Any]], output_path: str, backend: str = "openpyxl") -> Dict[str, float]:
+    """
+    すべてのシートのデータフレームをエクセルファイルに書き出す。
+    ローカルの一時ファイルに書き出してから出力先へ置き換える。
+    Args:
+        backend (str): 書き出し方式(EXCEL_WRITER_BACKENDSのいずれか)
+    Returns:
+        Dict[str, float]: シートごとの書き出し時間[s]
+    """
+    if backend not in _EXCEL_WRITERS:
+        raise ValueError(f"Unknown Excel writer backend: {backend}")
+    fd, local_path = tempfile.mkstemp(suffix='.xlsx')
+    os.close(fd)
+    try:
+        s_time = time.perf_counter()
+        sheet_times = _EXCEL_WRITERS[backend](_iter_sheet_frames(sensor_sheets), local_path)
+        write_time = time.perf_counter() - s_time
+        s_time = time.perf_counter()
+        replace_file(local_path, output_path)
+        move_time = time.perf_counter() - s_time
+        print(f"データをエクセルファイル '{output_path}' に出力しました。")
+    except Exception as e:
+        print(f"エクセルファイルへの書き出し中にエラーが発生しました: {e}")
+        raise
+    finally:
+        os.remove(local_path)
+    print(f"エクセル書き出し時間 ({backend}): 書き出し {write_time:.3f}s, 出力先への配置 {move_time:.3f}s")
+    for sheet_name, elapsed in sheet_times.items():
+        print(f"  {sheet_name}: {elapsed:.3f}s")
+    return sheet_times
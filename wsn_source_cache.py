@@ -0,0 +1,127 @@
+import os
+import time
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, List, Tuple
+
+from create_dir import COPY_THREADS, PARTIAL_SUFFIX, copy_file
+
+# キャッシュの上限サイズの既定値[MB]
+DEFAULT_CACHE_SIZE_MB = 2048
+CACHE_INDEX_NAME = 'cache_index.db'
+
+
+class SourceCache:
+    """
+    共有フォルダのロガーCSVをローカルのフォルダにキャッシュする(リードスルー)。
+    キャッシュはsource_rootからの相対パスのまま保存し、合計サイズがmax_bytesを超えた場合は
+    最後に使われた時刻が古いものから削除する。
+    """
+
+    def __init__(self, source_root: str, cache_dir: str, max_bytes: int) -> None:
+        os.makedirs(cache_dir, exist_ok=True)
+        self.source_root = os.path.abspath(source_root)
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self._conn = sqlite3.connect(os.path.join(cache_dir, CACHE_INDEX_NAME))
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS cache_entry ("
+            " rel_path TEXT PRIMARY KEY,"
+            " size INTEGER NOT NULL,"
+            " last_access_ns INTEGER NOT NULL)"
+        )
+        self._conn.commit()
+
+    def local_path(self, source_path: str) -> str:
+        rel_path = os.path.relpath(os.path.abspath(source_path), self.source_root)
+        if rel_path.startswith(os.pardir):
+            raise ValueError(f"{source_path} is not under {self.source_root}")
+        return os.path.join(self.cache_dir, rel_path)
+
+    def _fetch(self, source_path: str) -> Tuple[str, str, int]:
+        """
+        1ファイルをキャッシュに取り込む。コピー元とサイズ・更新日時が一致していれば取り込まない。
+        ロガーCSVは追記のみのため、コピー元が大きくなった場合は既存のキャッシュの続きから取り込む。
+        """
+        local_path = self.local_path(source_path)
+        os.makedirs(os.path.dirname(local_path), exist_ok=True)
+        if os.path.exists(local_path) and os.path.getsize(local_path) < os.path.getsize(source_path):
+            os.replace(local_path, local_path + PARTIAL_SUFFIX)
+        result = copy_file(source_path, local_path)
+        if result.status == "failed":
+            raise OSError(result.error)
+        return local_path, result.status, result.bytes_copied
+
+    def fetch_many(self, source_paths: Iterable[str], threads: int = COPY_THREADS) -> Dict[str, str]:
+        """
+        ファイルをまとめてキャッシュに取り込み、コピー元のパスとローカルのパスの対応を返す。
+        取り込みに失敗したファイルは警告して結果から除く。取り込んだファイルは削除の対象にしない。
+        """
+        source_paths = list(dict.fromkeys(source_paths))
+
+        def fetch(source_path: str):
+            try:
+                return source_path, self._fetch(source_path)
+            except (OSError, ValueError) as e:
+                print(f"警告: キャッシュへの取り込みに失敗しました: {source_path} ({e})")
+                return source_path, None
+
+        with ThreadPoolExecutor(max_workers=threads) as executor:
+            fetched = [(path, result) for path, result in executor.map(fetch, source_paths) if result is not None]
+
+        local_paths = {}
+        now = time.time_ns()
+        rows = []
+        fetched_bytes = 0
+        for source_path, (local_path, status, bytes_copied) in fetched:
+            local_paths[source_path] = local_path
+            fetched_bytes += bytes_copied
+            rows.append((os.path.relpath(local_path, self.cache_dir), os.path.getsize(local_path), now))
+        with self._conn:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO cache_entry (rel_path, size, last_access_ns) VALUES (?, ?, ?)", rows
+            )
+        hits = sum(status == "skipped" for _, (_, status, _) in fetched)
+        print(f"キャッシュ: {len(fetched)} 件(キャッシュ済み {hits} 件, 取り込み {fetched_bytes / 1024 / 1024:.1f} MB)")
+        self.evict(pinned=[row[0] for row in rows])
+        return local_paths
+
+    def evict(self, pinned: Iterable[str] = ()) -> List[str]:
+        """
+        合計サイズがmax_bytes以下になるまで、最後に使われた時刻が古いものから削除する。
+        pinned(キャッシュフォルダからの相対パス)は削除しない。
+        """
+        pinned = set(pinned)
+        entries = self._conn.execute(
+            "SELECT rel_path, size FROM cache_entry ORDER BY last_access_ns"
+        ).fetchall()
+        total = sum(size for _, size in entries)
+        removed = []
+        for rel_path, size in entries:
+            if total <= self.max_bytes:
+                break
+            if rel_path in pinned:
+                continue
+            for path in (os.path.join(self.cache_dir, rel_path),
+                         os.path.join(self.cache_dir, rel_path) + PARTIAL_SUFFIX):
+                if os.path.exists(path):
+                    os.remove(path)
+            removed.append(rel_path)
+            total -= size
+        if removed:
+            with self._conn:
+                self._conn.executemany("DELETE FROM cache_entry WHERE rel_path = ?", [(p,) for p in removed])
+            print(f"キャッシュから {len(removed)} 件を削除しました。")
+        if total > self.max_bytes:
+            print(f"警告: 処理中のファイルだけでキャッシュの上限を超えています({total / 1024 / 1024:.1f} MB)。")
+        return removed
+
+    def close(self) -> None:
+        self._conn.close()
+
+    def __enter__(self) -> "SourceCache":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()